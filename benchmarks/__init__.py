@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from time import perf_counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+BENCHMARKS = [
+    "saves",
+    "m2m",
+    "histories",
+    "admin",
+    "storage",
+    "concurrency",
+]
+
+
+def measure(func, number=1):
+    """
+    call func number times, return the elapsed milliseconds and the queries for each call
+    """
+    start = perf_counter()
+    for _ in range(number):
+        func()
+    elapsed = perf_counter() - start
+    with CaptureQueriesContext(connection) as ctx:
+        func()
+    return {"ms": elapsed * 1000 / number, "queries": len(ctx)}
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from model_history.models import History
+
+from . import measure
+
+
+def run(lengths=(10, 1000), reads=10):
+    """
+    rendering time of the admin pages for long histories
+    """
+    results = {}
+    client = Client()
+    History.register(User, exclude=["password", "last_login"])
+    try:
+        for length in lengths:
+            with transaction.atomic():
+                client.force_login(User.objects.create_superuser(username="admin", password="admin"))
+                user = User.objects.create(username="bench")
+                for n in range(length):
+                    user.first_name = f"name {n}"
+                    user.save()
+                history = History.objects.fetch(user)
+
+                def get(url, **params):
+                    response = client.get(url, params)
+                    assert response.status_code == 200, response.status_code
+
+                results[str(length)] = {
+                    "history_changelist": measure(
+                        lambda: get(reverse("admin:model_history_history_changelist")), reads
+                    ),
+                    "history_change": measure(
+                        lambda: get(reverse("admin:model_history_history_change", args=[history.pk])), reads
+                    ),
+                    "log_changelist": measure(
+                        lambda: get(
+                            reverse("admin:model_history_historylog_changelist"), history__id__exact=history.pk
+                        ),
+                        reads,
+                    ),
+                }
+                transaction.set_rollback(True)
+    finally:
+        History.unregister(User)
+    return results
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import override_settings
+
+from model_history.models import History
+
+from . import measure
+
+
+def run(concurrency=(1, 10, 50), rounds=5):
+    """
+    cost of logging from async code: the sync path, a sync_to_async hop for each step, and the async API,
+    with `concurrency` tasks logging different objects at once
+
+    the thread sensitive hops all run on the main thread, so the database calls of the tasks are serialized
+    """
+    results = {}
+    with transaction.atomic():
+        users = [User.objects.create(username=f"bench-{n}") for n in range(max(concurrency))]
+        versions = itertools.count()
+
+        def change(users):
+            version = next(versions)
+            for user in users:
+                user.first_name = f"name {version}"
+
+        async def hops(user):
+            history = await sync_to_async(History.objects.fetch)(user)
+            await sync_to_async(history.save)(exclude=["password"])
+
+        def gather(users, log):
+            async def main():
+                await asyncio.gather(*(log(user) for user in users))
+
+            change(users)
+            # async_to_sync from the main thread runs the thread sensitive code in it, in this transaction
+            async_to_sync(main)()
+
+        def log(users):
+            change(users)
+            for user in users:
+                History.objects.log(user, exclude=["password"])
+
+        for tasks in concurrency:
+            batch = users[:tasks]
+            results[str(tasks)] = {
+                "sync": measure(lambda: log(batch), rounds),
+                "hops": measure(lambda: gather(batch, hops), rounds),
+                "async": measure(
+                    lambda: gather(batch, lambda user: History.objects.alog(user, exclude=["password"])), rounds
+                ),
+            }
+
+        def timelines(users):
+            async def main():
+                histories = await asyncio.gather(*(History.objects.afetch(user) for user in users))
+                await asyncio.gather(*(history.aget_timeline() for history in histories))
+
+            async_to_sync(main)()
+
+        results["timeline"] = {
+            "sync": measure(lambda: [History.objects.fetch(user).get_timeline() for user in users], rounds),
+            "async": measure(lambda: timelines(users), rounds),
+        }
+        with override_settings(MODEL_HISTORY_TIMELINE_CACHE=True):
+            results["timeline"]["cached"] = measure(lambda: timelines(users), rounds)
+        transaction.set_rollback(True)
+    return results
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from model_history.models import History
+
+from . import measure
+
+
+def run(lengths=(10, 100, 1000), objects=100, reads=20):
+    """
+    cost of saving, fetching and reading long histories
+    """
+    results = {}
+    History.register(User, exclude=["password"])
+    try:
+        for length in lengths:
+            with transaction.atomic():
+                user = User.objects.create(username="bench")
+                for n in range(length):
+                    user.first_name = f"name {n}"
+                    user.save()
+
+                def save():
+                    user.first_name = f"{user.first_name}!"
+                    user.save()
+
+                def timeline():
+                    list(History.objects.fetch(user).iter_snapshots())
+
+                results[str(length)] = {
+                    "save": measure(save, reads),
+                    "fetch": measure(lambda: History.objects.fetch(user), reads),
+                    "timeline": measure(timeline),
+                }
+                transaction.set_rollback(True)
+
+        with transaction.atomic():
+            users = [User.objects.create(username=f"bench-{n}") for n in range(objects)]
+            for n in range(max(lengths) // 100):
+                for user in users:
+                    user.first_name = f"name {n}"
+                    user.save()
+            now = timezone.now()
+            results["as_of"] = measure(lambda: list(History.objects.as_of(User, now)))
+            results["as_of"]["objects"] = objects
+            transaction.set_rollback(True)
+    finally:
+        History.unregister(User)
+    return results
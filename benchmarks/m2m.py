@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import itertools
+
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.test import TestCase
+
+from model_history.models import History
+
+from . import measure
+
+
+def bench(registered, groups, changes):
+    if registered:
+        History.register(User, exclude=["password"])
+    try:
+        with transaction.atomic():
+            user = User.objects.create(username="bench")
+            pks = [Group.objects.create(name=f"bench-{n}").pk for n in range(groups)]
+
+            toggle = itertools.cycle([user.groups.add, user.groups.remove])
+
+            def single():
+                # changes are logged on commit
+                with TestCase.captureOnCommitCallbacks(execute=True):
+                    next(toggle)(pks[0])
+
+            def many():
+                with TestCase.captureOnCommitCallbacks(execute=True):
+                    user.groups.add(*pks)
+                    user.groups.remove(*pks[: len(pks) // 2])
+                    user.groups.clear()
+
+            results = {
+                "single": measure(single, changes),
+                "many": measure(many, changes),
+            }
+            transaction.set_rollback(True)
+    finally:
+        if registered:
+            History.unregister(User)
+    return results
+
+
+def run(groups=20, changes=50):
+    """
+    cost of the many to many changes of a registered model
+    """
+    return {
+        "unregistered": bench(False, groups, changes),
+        "registered": bench(True, groups, changes),
+    }
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from django.db import models
+
+WIDE_FIELDS = 50
+
+WideModel = type(
+    "WideModel",
+    (models.Model,),
+    {
+        "__module__": __name__,
+        **{f"field{n}": models.CharField(max_length=100, blank=True) for n in range(WIDE_FIELDS)},
+    },
+)
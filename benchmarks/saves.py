@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import itertools
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from model_history.models import History
+
+from . import measure
+from .models import WIDE_FIELDS, WideModel
+
+MODES = {
+    "unregistered": None,
+    "registered": {},
+    "track_changes": {"track_changes": True},
+}
+
+
+def create_user(counter):
+    return User.objects.create(username=f"bench-{next(counter)}")
+
+
+def change_user(user, value):
+    user.first_name = value
+
+
+def create_wide(counter):
+    return WideModel.objects.create(**{f"field{n}": f"value {n}" for n in range(WIDE_FIELDS)})
+
+
+def change_wide(instance, value):
+    instance.field0 = value
+
+
+def bench(model, create, change, options, saves):
+    if options is not None:
+        History.register(model, **options)
+    try:
+        with transaction.atomic():
+            counter = itertools.count()
+            instance = create(counter)
+            versions = itertools.count()
+
+            def save():
+                change(instance, f"value {next(versions)}")
+                instance.save()
+
+            results = {
+                "create": measure(lambda: create(counter), saves),
+                "save": measure(save, saves),
+            }
+            # loaded again, the tracked state of the saved instance is only recorded at commit
+            results["noop_save"] = measure(model.objects.get(pk=instance.pk).save, saves)
+            transaction.set_rollback(True)
+    finally:
+        if options is not None:
+            History.unregister(model)
+    return results
+
+
+def run(saves=200):
+    """
+    per save cost of a registered model compared to an unregistered one
+    """
+    results = {}
+    models = [
+        ("user", User, create_user, change_user),
+        ("wide", WideModel, create_wide, change_wide),
+    ]
+    for name, model, create, change in models:
+        results[name] = {mode: bench(model, create, change, options, saves) for mode, options in MODES.items()}
+        base = results[name]["unregistered"]
+        for mode in MODES:
+            for op, result in results[name][mode].items():
+                result["overhead"] = result["ms"] / base[op]["ms"] if base[op]["ms"] else None
+    return results
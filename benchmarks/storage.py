@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from model_history.models import History, HistoryLog
+
+
+def size(data):
+    return len(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def run(versions=500, keyframe_interval=10, reads=50):
+    """
+    compare full snapshots and delta storage: table size and read latency
+    """
+    results = {}
+    for name, interval in [("full", None), ("delta", keyframe_interval)]:
+        History.register(User, exclude=["password"], keyframe_interval=interval)
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username=f"bench-{name}")
+                for n in range(versions):
+                    user.first_name = f"name {n}"
+                    user.save()
+                history = History.objects.fetch(user)
+                logs = list(history.logs.order_by("pk"))
+
+                start = perf_counter()
+                list(history.iter_snapshots())
+                timeline = perf_counter() - start
+
+                step = max(len(logs) // reads, 1)
+                pks = [log.pk for log in logs[::step]]
+                start = perf_counter()
+                for pk in pks:
+                    HistoryLog.objects.get(pk=pk).get_fields()
+                point = (perf_counter() - start) / len(pks)
+
+                results[name] = {
+                    "logs": len(logs),
+                    "bytes": sum(size(log.fields) + size(log.updated) for log in logs),
+                    "timeline_read_ms": timeline * 1000,
+                    "point_read_ms": point * 1000,
+                }
+                transaction.set_rollback(True)
+        finally:
+            History.unregister(User)
+    return results
@@ -21,39 +21,102 @@
 from __future__ import annotations
 
 import json
+import re
 
 from django import forms
 from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
 from django.core.serializers.json import DjangoJSONEncoder
-from django.utils.safestring import mark_safe
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext_lazy as _
 
 from .models import History, HistoryLog
 
+# "app_label.model:source_key" (or "app_label.model source_key") and "source_key"
+# hit the (source_key, source_type) unique index, "app_label.model" the source_type index
+SEARCH_RE = re.compile(r"^(?P<app_label>\w+)\.(?P<model>\w+)(?:[\s:]+(?P<source_key>\S+))?$")
 
-class HistoryLogForm(forms.ModelForm):
-    class Meta:
-        exclude = ["created_at", "last_modified_at", "fields", "updated"]
 
+def pretty(data):
+    return format_html(
+        """<pre style="white-space: pre-wrap;">{}</pre>""",
+        json.dumps(data, sort_keys=True, indent=2, cls=DjangoJSONEncoder),
+    )
 
-class HistoryLogInline(admin.TabularInline):
-    extra = 0
-    form = HistoryLogForm
-    model = HistoryLog
-    ordering = ["-created_at"]
-    readonly_fields = ["label", "_fields", "_updated"]
 
-    def _pretty(self, data):
-        pretty_data = json.dumps(data, sort_keys=True, indent=2, cls=DjangoJSONEncoder)
-        return mark_safe(f"""<pre style="white-space: pre-wrap;">{pretty_data}</pre>""")
+def render_diff(log, fields=None):
+    """Render only the changed fields of log, as ``old → new`` when fields is given."""
+    if not log.updated:
+        return "-"
+    if fields is None:
+        rows = ((key, json.dumps(value, cls=DjangoJSONEncoder)) for key, value in sorted(log.updated.items()))
+        return format_html_join("", "<div><strong>{}</strong>: {}</div>", rows)
+    rows = (
+        (
+            key,
+            json.dumps(value, cls=DjangoJSONEncoder),
+            json.dumps(fields.get(key), cls=DjangoJSONEncoder),
+        )
+        for key, value in sorted(log.updated.items())
+    )
+    return format_html_join("", "<div><strong>{}</strong>: {} &rarr; {}</div>", rows)
 
-    @admin.display(description=_("fields"))
-    def _fields(self, obj):
-        return self._pretty(obj.fields)
+
+@admin.register(HistoryLog)
+class HistoryLogAdmin(admin.ModelAdmin):
+    fields = ["history", "label", "created_at", "delta", "_updated", "_fields"]
+    list_display = ["created_at", "label", "history", "_changes"]
+    list_per_page = 50
+    list_select_related = ["history"]
+    ordering = ["-created_at", "-pk"]
+    readonly_fields = fields
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        if match is not None and match.url_name and match.url_name.endswith("_changelist"):
+            # the changelist never renders the stored snapshots
+            queryset = queryset.defer("fields", "history__snapshot")
+        return queryset
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description=_("changed fields"))
+    def _changes(self, obj):
+        return ", ".join(sorted(obj.updated or ())) or "-"
 
     @admin.display(description=_("updated fields"))
     def _updated(self, obj):
-        return self._pretty(obj.updated)
+        return render_diff(obj, obj.get_fields())
+
+    @admin.display(description=_("fields"))
+    def _fields(self, obj):
+        return pretty(obj.get_fields())
+
+
+class SourceTypeListFilter(admin.SimpleListFilter):
+    """
+    Filter on the indexed source type, offering the registered models instead of scanning the histories.
+    """
+
+    title = _("source content type")
+    parameter_name = "source_type"
+
+    def lookups(self, request, model_admin):
+        content_types = ContentType.objects.get_for_models(*History._registry).values()
+        choices = ((str(ct.pk), f"{ct.app_label}.{ct.model}") for ct in content_types)
+        return sorted(choices, key=lambda choice: choice[1])
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(source_type=self.value())
 
 
 class HistoryForm(forms.ModelForm):
@@ -64,8 +127,57 @@ class HistoryForm(forms.ModelForm):
 @admin.register(History)
 class HistoryAdmin(admin.ModelAdmin):
     form = HistoryForm
-    inlines = [HistoryLogInline]
-    list_filter = ["app_label", "model"]
-    ordering = ["-created_at"]
-    readonly_fields = ["created_at", "label", "last_modified_at", "app_label", "model", "source_id"]
-    search_fields = ["source_type", "source_id"]
+    list_display = ["label", "app_label", "model", "source_key", "last_modified_at"]
+    list_filter = [SourceTypeListFilter]
+    list_per_page = 50
+    list_select_related = ["source_type"]
+    logs_per_page = 20
+    ordering = ["-pk"]
+    readonly_fields = [
+        "created_at",
+        "label",
+        "last_modified_at",
+        "app_label",
+        "model",
+        "source_id",
+        "source_key",
+        "_logs",
+    ]
+    search_fields = ["=source_key"]
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("snapshot")
+
+    def get_search_results(self, request, queryset, search_term):
+        # only indexed lookups are supported, never scan the table
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        match = SEARCH_RE.match(term)
+        if match is None:
+            if len(term.split()) > 1:
+                return queryset.none(), False
+            return queryset.filter(source_key=term), False
+        try:
+            source_type = ContentType.objects.get_by_natural_key(match["app_label"].lower(), match["model"].lower())
+        except ContentType.DoesNotExist:
+            return queryset.none(), False
+        queryset = queryset.filter(source_type=source_type)
+        if match["source_key"] is not None:
+            queryset = queryset.filter(source_key=match["source_key"])
+        return queryset, False
+
+    @admin.display(description=_("logs"))
+    def _logs(self, obj):
+        if obj.pk is None:
+            return "-"
+        logs = list(obj.logs.defer("fields").order_by("-created_at", "-pk")[: self.logs_per_page + 1])
+        rows = format_html_join(
+            "",
+            "<tr><td>{}</td><td>{}</td><td>{}</td></tr>",
+            ((log.created_at, log.label, render_diff(log)) for log in logs[: self.logs_per_page]),
+        )
+        url = reverse("admin:model_history_historylog_changelist") + f"?history__id__exact={obj.pk}"
+        more = _("all logs") if len(logs) > self.logs_per_page else _("browse logs")
+        return format_html("""<table>{}</table><p><a href="{}">{}</a></p>""", rows, url, more)
@@ -0,0 +1,116 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+
+__all__ = ["backfill", "serialize_chunk"]
+
+
+# spawned workers import this module before django is set up, so models are imported lazily
+def setup():
+    if not apps.ready:
+        django.setup()
+
+
+def serialize_chunk(label, pks, exclude=None, engine=None, using=None):
+    """
+    return the (pk, fields, label) snapshots of the rows of the model label with the given pks
+
+    it runs in the worker processes, so it takes only picklable arguments
+    """
+    from .models import History
+
+    model = apps.get_model(label)
+    serializer_class = History.build_serializer_class(model, exclude_opt=exclude, engine=engine)
+    queryset = model._base_manager.using(using).prefetch_related(*[field.name for field in model._meta.many_to_many])
+    return [(instance.pk, serializer_class(instance).data, str(instance)) for instance in queryset.filter(pk__in=pks)]
+
+
+def get_chunks(model, chunk_size, start_after, using):
+    """
+    yield (last pk, pks without history) for every chunk of `chunk_size` primary keys
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    from .models import History, get_source_key
+
+    source_type = ContentType.objects.db_manager(using).get_for_model(model)
+    rows = model._base_manager.using(using).order_by("pk").values_list("pk", flat=True)
+    histories = History.objects.using(using).filter(source_type=source_type)
+    last = start_after
+    while pks := list((rows if last is None else rows.filter(pk__gt=last))[:chunk_size]):
+        keys = {get_source_key(pk): pk for pk in pks}
+        existing = set(histories.filter(source_key__in=keys).values_list("source_key", flat=True))
+        last = pks[-1]
+        yield last, [pk for key, pk in keys.items() if key not in existing]
+
+
+def backfill(model, chunk_size=1000, start_after=None, processes=1, using=None):
+    """
+    log a baseline snapshot of every row of a registered model without history, yield (last pk, logged rows)
+
+    rows are walked in primary key chunks; with `processes` > 1 the chunks are serialized in a pool of worker
+    processes (which set django up on their own), while histories and logs are bulk inserted by the caller
+
+    rows which already have a history are skipped, so a run can be repeated,
+    or resumed passing the last yielded pk as `start_after`
+    """
+    from .models import History
+
+    callback = History._registry.get(model)
+    if callback is None:
+        raise ValueError(f"Model {model._meta.label_lower} is not registered.")
+    args = (model._meta.label_lower, callback.exclude, callback.engine, using)
+    manager = History.objects.db_manager(using)
+
+    def write(last, snapshots):
+        # a transaction for each chunk
+        logs = manager._log_snapshots([(model, pk, fields, label) for pk, fields, label in snapshots])
+        return last, len(logs)
+
+    chunks = get_chunks(model, chunk_size, start_after, using)
+    if processes <= 1:
+        for last, pks in chunks:
+            yield write(last, serialize_chunk(args[0], pks, *args[1:]) if pks else [])
+        return
+
+    # spawned workers do not share the database connections of this process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=setup) as executor:
+        pending = deque()
+        for last, pks in chunks:
+            pending.append((last, executor.submit(serialize_chunk, args[0], pks, *args[1:]) if pks else None))
+            # keep a bounded number of chunks in flight, written in order
+            while len(pending) > processes * 2:
+                yield write(*resolve(pending.popleft()))
+        while pending:
+            yield write(*resolve(pending.popleft()))
+
+
+def resolve(item):
+    last, future = item
+    return last, [] if future is None else future.result()
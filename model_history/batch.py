@@ -0,0 +1,184 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import json
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+__all__ = ["Batch", "RelationsPatch", "schedule", "schedule_relations"]
+
+
+class RelationsPatch:
+    """
+    Many to many changes of an instance, applied to its last logged snapshot.
+
+    If the instance was never logged it is fully serialized instead.
+    """
+
+    def __init__(self, instance, callback):
+        self.instance = instance
+        self.callback = callback
+        self.relations = {}
+
+    def change(self, field_name, action, pks):
+        if action == "post_clear":
+            self.relations[field_name] = [True, set(), set()]
+            return
+        cleared, added, removed = self.relations.setdefault(field_name, [False, set(), set()])
+        # pks are compared with the serialized values
+        pks = set(json.loads(json.dumps(list(pks), cls=DjangoJSONEncoder)))
+        if action == "post_add":
+            added |= pks
+            removed -= pks
+        elif action == "post_remove":
+            removed |= pks
+            added -= pks
+
+    def __call__(self, prev_fields):
+        if prev_fields is None:
+            return self.callback.serialize(self.instance)
+        fields = dict(prev_fields)
+        for field_name, (cleared, added, removed) in self.relations.items():
+            if field_name not in fields:
+                continue
+            if self.instance._meta.get_field(field_name).related_model._meta.ordering:
+                # serialized in the ordering of the related model, which pks alone cannot rebuild
+                values = getattr(self.instance, field_name).values_list("pk", flat=True)
+                fields[field_name] = json.loads(json.dumps(list(values), cls=DjangoJSONEncoder))
+                continue
+            values = set() if cleared else {value for value in fields[field_name] if value not in removed}
+            # in primary key order, like a fresh serialization
+            fields[field_name] = sorted(values | added)
+        return fields
+
+
+class Batch:
+    """
+    Collect the instances changed inside a transaction and log them once at commit.
+
+    Instances are de-duplicated by (model, pk), and their rows are loaded again at commit,
+    so an object saved several times in the same transaction gets a single snapshot of its committed state,
+    without unsaved changes of the in-memory instance or changes rolled back to a savepoint.
+    Deleted instances are serialized as soon as they are marked, as they could not
+    be serialized anymore at commit time, and are logged with their row if the delete was rolled back.
+    Many to many changes of instances not otherwise saved are applied to their last snapshot.
+    """
+
+    def __init__(self, using, reload=True):
+        self.using = using
+        # False when flushed right after the save, in autocommit mode
+        self.reload = reload
+        self.pending = {}
+        self.flushed = False
+
+    def add(self, instance, callback, deleted=False):
+        if deleted:
+            self.pending[type(instance), instance.pk] = (instance, callback, callback.serialize(instance))
+        else:
+            self.pending[type(instance), instance.pk] = (None if self.reload else instance, callback, None)
+        return self
+
+    def add_relations(self, model, pk, callback, field_name, action, pks, instance=None):
+        if (model, pk) not in self.pending:
+            self.pending[model, pk] = (instance, callback, RelationsPatch(instance, callback))
+        snapshot = self.pending[model, pk][2]
+        if isinstance(snapshot, RelationsPatch):
+            # otherwise a full snapshot is already pending
+            snapshot.change(field_name, action, pks)
+        return self
+
+    def is_scheduled(self, connection):
+        return not self.flushed and any(entry[1] == self.flush for entry in connection.run_on_commit)
+
+    def load_instances(self, pending):
+        missing = defaultdict(list)
+        for (model, pk), (instance, callback, snapshot) in pending.items():
+            if instance is None or self.reload:
+                missing[model].append(pk)
+        for model, pks in missing.items():
+            instances = model._base_manager.using(self.using).in_bulk(pks)
+            for pk in pks:
+                instance, callback, snapshot = pending.pop((model, pk))
+                deleted = snapshot is not None and not isinstance(snapshot, RelationsPatch)
+                if pk in instances:
+                    if isinstance(snapshot, RelationsPatch):
+                        snapshot.instance = instances[pk]
+                    elif deleted:
+                        # the delete was rolled back to a savepoint
+                        snapshot = None
+                    pending[model, pk] = (instances[pk], callback, snapshot)
+                elif deleted:
+                    pending[model, pk] = (instance, callback, snapshot)
+
+    def flush(self):
+        from .models import History
+
+        pending, self.pending, self.flushed = self.pending, {}, True
+        self.load_instances(pending)
+        snapshots = []
+        for (model, pk), (instance, callback, snapshot) in pending.items():
+            if snapshot is None:
+                snapshot = callback.serialize(instance)
+            snapshots.append((model, pk, snapshot, str(instance)))
+        if snapshots:
+            History.objects.db_manager(self.using)._log_snapshots(snapshots)
+
+
+def get_batch(using):
+    """
+    return the batch of the current transaction on `using` database, None in autocommit mode
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return None
+    batch = getattr(connection, "model_history_batch", None)
+    if batch is None or not batch.is_scheduled(connection):
+        batch = connection.model_history_batch = Batch(using)
+        transaction.on_commit(batch.flush, using=using)
+    return batch
+
+
+def schedule(instance, callback, using, deleted=False):
+    """
+    mark instance as dirty for the current transaction on `using` database
+    """
+    batch = get_batch(using)
+    if batch is None:
+        Batch(using, reload=False).add(instance, callback, deleted=deleted).flush()
+    else:
+        batch.add(instance, callback, deleted=deleted)
+
+
+def schedule_relations(model, pks, callback, field_name, action, values, using, instance=None):
+    """
+    mark a many to many change of `model` instances with `pks` for the current transaction on `using` database
+    """
+    batch = get_batch(using)
+    immediate = batch is None
+    if immediate:
+        batch = Batch(using, reload=False)
+    for pk in pks:
+        batch.add_relations(model, pk, callback, field_name, action, values, instance=instance)
+    if immediate:
+        batch.flush()
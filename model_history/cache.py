@@ -0,0 +1,208 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+
+from .metrics import record
+
+__all__ = ["TimelineCache", "aget_timeline", "get_timeline", "get_timeline_cache"]
+
+# the log columns of a timeline entry, like HistoryLogQuerySet.summaries()
+FIELDS = ["id", "created_at", "last_modified_at", "history_id", "label", "delta"]
+
+
+class TimelineCache:
+    """
+    Read-through cache of history timelines, in a Django cache.
+
+    Every entry holds the last `size` log summaries and the current snapshot of an history,
+    and is keyed on the history pk and its last log pk: appending a log changes the key,
+    so every process reads the new timeline, and the stale entries expire after `timeout` seconds.
+    """
+
+    def __init__(self, alias="default", size=20, timeout=300, prefix="model_history:timeline"):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def get_key(self, history_id, head_id):
+        return f"{self.prefix}:{history_id}:{head_id}"
+
+    def count(self, history, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        record(f"{history.app_label}.{history.model}", "hit" if hit else "miss")
+
+    def stats(self):
+        """
+        return the {"hits", "misses"} counters of this process
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def get(self, history):
+        """
+        return (the last logs, newest first, json columns deferred; the current snapshot) of a saved history
+        """
+        key = self.get_key(history.pk, history.head_id)
+        entry = self.cache.get(key)
+        self.count(history, entry is not None)
+        if entry is None:
+            entry = build_entry(history, self.size)
+            self.cache.set(key, entry, self.timeout)
+        return load_entry(history, entry)
+
+    async def aget(self, history):
+        """
+        async version of `get()`
+        """
+        key = self.get_key(history.pk, history.head_id)
+        cache = self.cache
+        # caches have async methods since Django 4.0
+        async_cache = hasattr(cache, "aget")
+        entry = await cache.aget(key) if async_cache else await sync_to_async(cache.get)(key)
+        self.count(history, entry is not None)
+        if entry is None:
+            entry = await sync_to_async(build_entry)(history, self.size)
+            if async_cache:
+                await cache.aset(key, entry, self.timeout)
+            else:
+                await sync_to_async(cache.set)(key, entry, self.timeout)
+        return load_entry(history, entry)
+
+    def append(self, history, previous_head_id, log, using=None):
+        """
+        move the cached timeline of an history to its new key, with a new log, when the transaction commits
+
+        the entry is built from the state of the history now, a rolled back log never reaches the cache
+        """
+        previous_key = self.get_key(history.pk, previous_head_id)
+        key = self.get_key(history.pk, history.head_id)
+        row = tuple(getattr(log, field) for field in FIELDS)
+        fields = get_fields(history)
+
+        def move():
+            entry = self.cache.get(previous_key)
+            if entry is None:
+                return
+            self.cache.set(key, {"logs": [row, *entry["logs"][: self.size - 1]], "fields": fields}, self.timeout)
+            self.cache.delete(previous_key)
+
+        transaction.on_commit(move, using=using)
+
+    def invalidate(self, histories):
+        """
+        drop the cached timelines of (history pk, last log pk) pairs, after their logs are deleted
+        """
+        self.cache.delete_many([self.get_key(history_id, head_id) for history_id, head_id in histories])
+
+
+def get_fields(history):
+    fields = history.get_current_fields()
+    # decompress a lazy json before caching it
+    return None if fields is None else dict(fields)
+
+
+def build_entry(history, size):
+    logs = history.logs.order_by("-created_at", "-pk").values_list(*FIELDS)[:size]
+    return {"logs": list(logs), "fields": get_fields(history)}
+
+
+def load_entry(history, entry):
+    from .models import HistoryLog
+
+    db = history._state.db
+    return [HistoryLog.from_db(db, FIELDS, row) for row in entry["logs"]], entry["fields"]
+
+
+_timeline_cache = None
+_timeline_cache_lock = threading.Lock()
+
+
+def get_timeline_cache():
+    """
+    return the cache configured in the MODEL_HISTORY_TIMELINE_CACHE setting, or None if it is disabled
+
+    the setting is True for the defaults, or a dict of the TimelineCache options, like
+
+        MODEL_HISTORY_TIMELINE_CACHE = {"alias": "default", "size": 20, "timeout": 300}
+    """
+    global _timeline_cache
+    if _timeline_cache is None:
+        config = getattr(settings, "MODEL_HISTORY_TIMELINE_CACHE", None)
+        if not config:
+            return None
+        with _timeline_cache_lock:
+            if _timeline_cache is None:
+                _timeline_cache = TimelineCache(**(config if isinstance(config, dict) else {}))
+    return _timeline_cache
+
+
+def reset_timeline_cache(*, setting, **kwargs):
+    global _timeline_cache
+    if setting == "MODEL_HISTORY_TIMELINE_CACHE":
+        _timeline_cache = None
+
+
+setting_changed.connect(reset_timeline_cache)
+
+
+def get_timeline(history, size=20):
+    """
+    return (the last `size` logs, newest first, json columns deferred; the current snapshot) of an history,
+    read through the timeline cache if it is configured (with its own size)
+    """
+    if history.pk is None:
+        return [], None
+    timeline_cache = get_timeline_cache()
+    if timeline_cache is None:
+        return load_entry(history, build_entry(history, size))
+    return timeline_cache.get(history)
+
+
+async def aget_timeline(history, size=20):
+    """
+    async version of `get_timeline()`
+    """
+    if history.pk is None:
+        return [], None
+    timeline_cache = get_timeline_cache()
+    if timeline_cache is None:
+        return load_entry(history, await sync_to_async(build_entry)(history, size))
+    return await timeline_cache.aget(history)
@@ -0,0 +1,61 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+__all__ = ["get_indexed_models", "index_logs"]
+
+
+def get_indexed_models():
+    """
+    return the models registered with `index_changes=True`
+    """
+    from .models import History
+
+    return [model for model, callback in History._registry.items() if callback.index_changes]
+
+
+def index_logs(models, chunk_size=1000, start_after=None, using=None):
+    """
+    rebuild the changed fields index of the logs of `models`, a chunk of `chunk_size` logs at a time,
+    each in its own transaction; yield (last log pk, indexed fields)
+
+    pass the last yielded pk as `start_after` to resume an interrupted run
+    """
+    from .models import HistoryChangedField, HistoryLog
+
+    content_types = ContentType.objects.db_manager(using).get_for_models(*models).values()
+    logs = (
+        HistoryLog.objects.using(using)
+        .filter(history__source_type__in=content_types)
+        .order_by("pk")
+        .only("pk", "created_at", "updated")
+    )
+    manager = HistoryChangedField.objects.db_manager(using)
+    last = start_after
+    while chunk := list((logs if last is None else logs.filter(pk__gt=last))[:chunk_size]):
+        with transaction.atomic(using=using):
+            manager.filter(log__in=[log.pk for log in chunk]).delete()
+            indexed = manager.index([log for log in chunk if log.updated])
+        last = chunk[-1].pk
+        yield last, len(indexed)
@@ -0,0 +1,300 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import base64
+import json
+import lzma
+import threading
+import zlib
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import transaction
+
+__all__ = [
+    "CODECS",
+    "LazyJSON",
+    "LzmaCodec",
+    "ZlibCodec",
+    "ZstdCodec",
+    "compress_logs",
+    "get_codec",
+    "train_dictionary",
+]
+
+# compressed values are stored as {MARKER: codec name, "data": base64 payload},
+# model field names cannot contain "__", so the marker never clashes with a snapshot
+MARKER = "__compressed__"
+
+
+class ZlibCodec:
+    name = "zlib"
+
+    def __init__(self, level=6, min_size=256):
+        self.level = level
+        self.min_size = min_size
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LzmaCodec:
+    name = "lzma"
+
+    def __init__(self, level=6, min_size=256):
+        self.level = level
+        self.min_size = min_size
+
+    def compress(self, data):
+        return lzma.compress(data, preset=self.level)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+
+class ZstdCodec:
+    """
+    zstd codec, requires the zstandard package
+
+    `dictionary` is the path of a dictionary trained on existing logs (see `train_dictionary()`) to compress with,
+    `dictionaries` the paths of more dictionaries to decompress with (by default the
+    MODEL_HISTORY_COMPRESSION_DICTIONARIES setting): every dictionary which compressed some logs
+    must stay available to read them, even after the configured codec or dictionary changes
+    """
+
+    name = "zstd"
+
+    def __init__(self, level=3, min_size=256, dictionary=None, dictionaries=None):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImproperlyConfigured("The zstd compression codec requires the zstandard package.") from e
+
+        if dictionaries is None:
+            dictionaries = getattr(settings, "MODEL_HISTORY_COMPRESSION_DICTIONARIES", [])
+        dict_data = None if dictionary is None else load_dictionary(dictionary)
+        self.zstandard = zstandard
+        self.min_size = min_size
+        self.compressor = zstandard.ZstdCompressor(level=level, dict_data=dict_data)
+        # frames record the id of their dictionary, 0 for none
+        self.decompressors = {0: zstandard.ZstdDecompressor()}
+        for data in [dict_data, *(load_dictionary(path) for path in dictionaries)]:
+            if data is not None:
+                self.decompressors[data.dict_id()] = zstandard.ZstdDecompressor(dict_data=data)
+        self.lock = threading.Lock()
+
+    def compress(self, data):
+        # zstandard (de)compressors are not thread safe
+        with self.lock:
+            return self.compressor.compress(data)
+
+    def decompress(self, data):
+        dict_id = self.zstandard.get_frame_parameters(data).dict_id
+        try:
+            decompressor = self.decompressors[dict_id]
+        except KeyError:
+            raise ImproperlyConfigured(
+                f"zstd dictionary {dict_id} is not available, add it to MODEL_HISTORY_COMPRESSION_DICTIONARIES."
+            ) from None
+        with self.lock:
+            return decompressor.decompress(data)
+
+
+def load_dictionary(path):
+    import zstandard
+
+    with open(path, "rb") as fp:
+        return zstandard.ZstdCompressionDict(fp.read())
+
+
+CODECS = {
+    "zlib": ZlibCodec,
+    "lzma": LzmaCodec,
+    "zstd": ZstdCodec,
+}
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+
+def get_codec(name=None):
+    """
+    return the codec configured in the MODEL_HISTORY_COMPRESSION setting, or None if compression is disabled
+
+    the setting is a codec name or a dict of the codec options, like
+
+        MODEL_HISTORY_COMPRESSION = {"codec": "zstd", "level": 3, "dictionary": BASE_DIR / "history.dict"}
+
+    with a name, return that codec: the configured one if it has the same name, else one with default options,
+    which still reads the logs compressed with the dictionaries of the MODEL_HISTORY_COMPRESSION_DICTIONARIES setting
+    """
+    config = getattr(settings, "MODEL_HISTORY_COMPRESSION", None)
+    if isinstance(config, str):
+        config = {"codec": config}
+    if name is None:
+        if not config:
+            return None
+        name = config["codec"]
+    if name not in _codecs:
+        with _codecs_lock:
+            if name not in _codecs:
+                if name not in CODECS:
+                    raise ImproperlyConfigured(f"Unknown compression codec {name!r}.")
+                options = {key: value for key, value in (config or {}).items() if key != "codec"}
+                _codecs[name] = CODECS[name](**options) if config and config["codec"] == name else CODECS[name]()
+    return _codecs[name]
+
+
+def reset_codecs(*, setting, **kwargs):
+    if setting in {"MODEL_HISTORY_COMPRESSION", "MODEL_HISTORY_COMPRESSION_DICTIONARIES"}:
+        _codecs.clear()
+
+
+setting_changed.connect(reset_codecs)
+
+
+def is_compressed(value):
+    return isinstance(value, dict) and MARKER in value
+
+
+def compress(value, codec, encoder=DjangoJSONEncoder):
+    """
+    return the compressed envelope of a json value, or the value itself when it is too small to be worth it
+    """
+    if not isinstance(value, dict) or is_compressed(value):
+        return value
+    data = json.dumps(value, cls=encoder, separators=(",", ":")).encode()
+    if len(data) < codec.min_size:
+        return value
+    return {MARKER: codec.name, "data": base64.b64encode(codec.compress(data)).decode("ascii")}
+
+
+def decompress(value, decoder=None):
+    if not is_compressed(value):
+        return value
+    data = get_codec(value[MARKER]).decompress(base64.b64decode(value["data"]))
+    return json.loads(data, cls=decoder)
+
+
+class LazyJSON(Mapping):
+    """
+    A compressed json object, decompressed on first access.
+    """
+
+    __slots__ = ["envelope", "decoder", "_value"]
+
+    def __init__(self, envelope, decoder=None):
+        self.envelope = envelope
+        self.decoder = decoder
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = decompress(self.envelope, self.decoder)
+        return self._value
+
+    def __getitem__(self, key):
+        return self.value[key]
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __repr__(self):
+        return f"<LazyJSON {self.envelope[MARKER]}>"
+
+
+def train_dictionary(size=112640, samples=10000, using=None):
+    """
+    train a zstd dictionary on the last `samples` keyframes, return its bytes
+    """
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImproperlyConfigured("zstd dictionaries require the zstandard package.") from e
+    from .models import HistoryLog
+
+    logs = HistoryLog.objects.using(using).filter(delta=False).order_by("-pk").only("fields")[:samples]
+    data = [json.dumps(dict(log.fields), cls=DjangoJSONEncoder, separators=(",", ":")).encode() for log in logs]
+    return zstandard.train_dictionary(size, data).as_bytes()
+
+
+def compress_logs(chunk_size=1000, start_after=None, using=None):
+    """
+    rewrite the stored logs with the codec of the MODEL_HISTORY_COMPRESSION setting (uncompressed if not set),
+    a chunk of `chunk_size` primary keys at a time, each in its own transaction;
+    yield (last log pk, rewritten logs)
+
+    pass the last yielded pk as `start_after` to resume an interrupted run
+    """
+    from .models import HistoryLog
+
+    fields = [HistoryLog._meta.get_field("fields"), HistoryLog._meta.get_field("updated")]
+    logs = HistoryLog.objects.using(using).order_by("pk").only(*(field.attname for field in fields))
+    last = start_after
+    while chunk := list((logs if last is None else logs.filter(pk__gt=last))[:chunk_size]):
+        changed = []
+        for log in chunk:
+            stored = [log.__dict__[field.attname] for field in fields]
+            if not all(is_stored_with(value, field.get_codec(), field.encoder) for field, value in zip(fields, stored)):
+                # the field compresses (or not) the decompressed values on save
+                for field in fields:
+                    setattr(log, field.attname, getattr(log, field.attname))
+                changed.append(log)
+        if changed:
+            with transaction.atomic(using=using):
+                HistoryLog.objects.using(using).bulk_update(changed, [field.name for field in fields])
+        last = chunk[-1].pk
+        yield last, len(changed)
+
+
+def get_stored_codec(value):
+    """
+    return the codec name of a stored value, None if it is not compressed
+    """
+    if isinstance(value, LazyJSON):
+        value = value.envelope
+    return value[MARKER] if is_compressed(value) else None
+
+
+def is_stored_with(value, codec, encoder=DjangoJSONEncoder):
+    """
+    return True if a stored value is stored as `codec` would store it now,
+    compressed with it or left uncompressed when it is too small
+    """
+    stored = get_stored_codec(value)
+    if codec is None or stored is not None:
+        return stored == get_codec_name(codec)
+    return compress(value, codec, encoder) is value
+
+
+def get_codec_name(codec):
+    return None if codec is None else codec.name
@@ -0,0 +1,146 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import csv
+import json
+from collections.abc import Mapping
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+__all__ = ["COLUMNS", "FORMATS", "CSVWriter", "JSONLinesWriter", "export", "export_to_file", "get_logs"]
+
+COLUMNS = [
+    "id",
+    "created_at",
+    "history_id",
+    "app_label",
+    "model",
+    "source_id",
+    "source_key",
+    "label",
+    "delta",
+    "fields",
+    "updated",
+]
+
+
+def to_json(value):
+    # compressed values are read as lazy mappings
+    return dict(value) if isinstance(value, Mapping) else value
+
+
+class JSONLinesWriter:
+    extension = "jsonl"
+
+    def __init__(self, stream, header=True):
+        self.stream = stream
+
+    def write(self, row):
+        row["fields"], row["updated"] = to_json(row["fields"]), to_json(row["updated"])
+        self.stream.write(f"{json.dumps(row, cls=DjangoJSONEncoder)}\n")
+
+
+class CSVWriter:
+    """
+    fields and updated are written as json
+    """
+
+    extension = "csv"
+
+    def __init__(self, stream, header=True):
+        self.writer = csv.DictWriter(stream, COLUMNS)
+        if header:
+            self.writer.writeheader()
+
+    def write(self, row):
+        row["created_at"] = row["created_at"].isoformat()
+        row["fields"] = json.dumps(to_json(row["fields"]), cls=DjangoJSONEncoder)
+        row["updated"] = json.dumps(to_json(row["updated"]), cls=DjangoJSONEncoder)
+        self.writer.writerow(row)
+
+
+FORMATS = {
+    "jsonl": JSONLinesWriter,
+    "csv": CSVWriter,
+}
+
+
+def get_logs(model=None, since=None, until=None, after=None, using=None):
+    """
+    return the rows of the logs to export, in primary key order, as dicts of COLUMNS
+
+    logs can be filtered by model, created_at in [since, until), and primary key greater than `after`;
+    the rows of delta logs hold only the changed fields, like they are stored
+    """
+    from .models import HistoryLog
+
+    logs = HistoryLog.objects.using(using).order_by("pk")
+    if model is not None:
+        source_type = ContentType.objects.db_manager(using).get_for_model(model)
+        logs = logs.filter(history__source_type=source_type)
+    if since is not None:
+        logs = logs.filter(created_at__gte=since)
+    if until is not None:
+        logs = logs.filter(created_at__lt=until)
+    if after is not None:
+        logs = logs.filter(pk__gt=after)
+    return logs.values(
+        "id",
+        "created_at",
+        "history_id",
+        "label",
+        "delta",
+        "fields",
+        "updated",
+        app_label=models.F("history__app_label"),
+        model=models.F("history__model"),
+        source_id=models.F("history__source_id"),
+        source_key=models.F("history__source_key"),
+    )
+
+
+def export(stream, format="jsonl", chunk_size=2000, header=True, **filters):
+    """
+    write the logs to stream, return (exported logs, last log pk, last log created_at)
+
+    logs are read with `iterator(chunk_size)`, so from a server side cursor where supported, in constant memory;
+    pass the last pk as `after` to export only the following logs
+    """
+    writer = FORMATS[format](stream, header=header)
+    count, last_id, last_created_at = 0, None, None
+    for row in get_logs(**filters).iterator(chunk_size=chunk_size):
+        last_id, last_created_at = row["id"], row["created_at"]
+        writer.write(row)
+        count += 1
+    return count, last_id, last_created_at
+
+
+def export_to_file(path, format="jsonl", chunk_size=2000, **filters):
+    """
+    append the logs to the file at path, writing the csv header only to a new file; see `export()`
+
+    it can be used as the target of a worker process
+    """
+    with open(path, "a", newline="") as fp:
+        return export(fp, format=format, chunk_size=chunk_size, header=fp.tell() == 0, **filters)
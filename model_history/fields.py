@@ -22,8 +22,11 @@ from __future__ import annotations
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
 from django.utils import timezone
 
+from .compression import LazyJSON, compress, get_codec, is_compressed
+
 
 class CreationDateTimeField(models.DateTimeField):
     def __init__(self, *args, **kwargs):
@@ -51,3 +54,52 @@ class JSONField(models.JSONField):
         kwargs.setdefault("default", dict)
         kwargs.setdefault("encoder", DjangoJSONEncoder)
         super().__init__(*args, **kwargs)
+
+
+class CompressedAttribute(DeferredAttribute):
+    # a data descriptor, so __get__ is called even when the value is loaded
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, LazyJSON):
+            value = instance.__dict__[self.field.attname] = value.value
+        return value
+
+
+class CompressedJSONField(JSONField):
+    """
+    A JSONField compressing the stored objects with `codec`, or the codec of the MODEL_HISTORY_COMPRESSION setting
+
+    objects smaller than the codec `min_size` are stored as they are, like every object when compression is off;
+    compressed objects are decompressed on first attribute access
+    """
+
+    descriptor_class = CompressedAttribute
+
+    def __init__(self, *args, codec=None, **kwargs):
+        self.codec = codec
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.codec is not None:
+            kwargs["codec"] = self.codec
+        return name, path, args, kwargs
+
+    def get_codec(self):
+        return get_codec(self.codec) if self.codec is not None else get_codec()
+
+    def from_db_value(self, value, expression, connection):
+        value = super().from_db_value(value, expression, connection)
+        if is_compressed(value):
+            return LazyJSON(value, self.decoder)
+        return value
+
+    def get_prep_value(self, value):
+        if isinstance(value, LazyJSON):
+            value = value.envelope
+        elif (codec := self.get_codec()) is not None:
+            value = compress(value, codec, self.encoder)
+        return super().get_prep_value(value)
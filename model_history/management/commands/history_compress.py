@@ -0,0 +1,68 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from ...compression import compress_logs, get_codec, train_dictionary
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite the stored logs with the codec of the MODEL_HISTORY_COMPRESSION setting "
+        "(uncompressed if not set), or train a zstd dictionary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Logs rewritten in each transaction.")
+        parser.add_argument("--start-after", type=int, help="Resume after this log pk.")
+        parser.add_argument("--train-dictionary", metavar="PATH", help="Write a zstd dictionary trained on the logs.")
+        parser.add_argument("--samples", type=int, default=10000, help="Keyframes used to train the dictionary.")
+        parser.add_argument("--dictionary-size", type=int, default=112640, help="Dictionary size in bytes.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to use.")
+
+    def handle(self, *args, **options):
+        try:
+            if options["train_dictionary"]:
+                data = train_dictionary(options["dictionary_size"], options["samples"], using=options["database"])
+                with open(options["train_dictionary"], "wb") as fp:
+                    fp.write(data)
+                if options["verbosity"] > 0:
+                    self.stdout.write(f"Dictionary of {len(data)} bytes written to {options['train_dictionary']}.")
+                return
+            codec = get_codec()
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+
+        total = 0
+        for last, count in compress_logs(
+            chunk_size=options["chunk_size"],
+            start_after=options["start_after"],
+            using=options["database"],
+        ):
+            total += count
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Processed up to log {last}, {count} logs rewritten.")
+        if options["verbosity"] > 0:
+            name = "uncompressed" if codec is None else codec.name
+            self.stdout.write(f"{total} logs rewritten ({name}).")
@@ -0,0 +1,132 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.dateparse import parse_datetime
+
+from ...export import FORMATS, export, export_to_file
+
+
+def datetime(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid datetime {value!r}.")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Stream history logs as JSON Lines or CSV, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", action="append", help="Export this model (app_label.model_name), repeatable.")
+        parser.add_argument("--format", choices=list(FORMATS), default="jsonl", help="Output format.")
+        parser.add_argument(
+            "--output",
+            help="Append to this file (default: stdout), or to a file for each model in this directory.",
+        )
+        parser.add_argument("--since", type=datetime, help="Export the logs created at or after this datetime.")
+        parser.add_argument("--until", type=datetime, help="Export the logs created before this datetime.")
+        parser.add_argument("--after-id", type=int, help="Export the logs following this log pk.")
+        parser.add_argument(
+            "--state",
+            help="JSON file with the last exported log of each model, read to resume and updated after the export.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched at a time.")
+        parser.add_argument("--processes", type=int, default=1, help="Export the models in parallel processes.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to use.")
+
+    def handle(self, *args, **options):
+        try:
+            models = [apps.get_model(label) for label in options["model"] or []]
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        by_model = options["output"] is not None and os.path.isdir(options["output"])
+        if options["processes"] > 1 and not by_model:
+            raise CommandError("--processes requires --output to be a directory.")
+
+        state = {}
+        if options["state"] and os.path.exists(options["state"]):
+            with open(options["state"]) as fp:
+                state = json.load(fp)
+
+        jobs = []
+        for model in models or [None]:
+            key = "*" if model is None else model._meta.label_lower
+            after = options["after_id"]
+            if after is None and key in state:
+                after = state[key]["id"]
+            filters = {
+                "model": model,
+                "since": options["since"],
+                "until": options["until"],
+                "after": after,
+                "using": options["database"],
+            }
+            jobs.append((key, filters))
+
+        results = self.run(jobs, options, by_model)
+        for key, (count, last_id, last_created_at) in results.items():
+            if last_id is not None:
+                state[key] = {"id": last_id, "created_at": last_created_at.isoformat()}
+            if options["verbosity"] > 1 or (options["verbosity"] > 0 and options["output"]):
+                self.stderr.write(f"{key}: {count} logs exported.")
+
+        if options["state"]:
+            tmp = f"{options['state']}.tmp"
+            with open(tmp, "w") as fp:
+                json.dump(state, fp, indent=2, sort_keys=True)
+            os.replace(tmp, options["state"])
+
+    def run(self, jobs, options, by_model):
+        format, chunk_size = options["format"], options["chunk_size"]
+        if by_model:
+            extension = FORMATS[format].extension
+            paths = {key: os.path.join(options["output"], f"{key}.{extension}") for key, filters in jobs}
+            if options["processes"] > 1:
+                # workers open their own connections
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=options["processes"]) as executor:
+                    futures = {
+                        key: executor.submit(export_to_file, paths[key], format, chunk_size, **filters)
+                        for key, filters in jobs
+                    }
+                    return {key: future.result() for key, future in futures.items()}
+            return {key: export_to_file(paths[key], format, chunk_size, **filters) for key, filters in jobs}
+
+        if options["output"]:
+            with open(options["output"], "a", newline="") as fp:
+                return self.export(fp, jobs, format, chunk_size, header=fp.tell() == 0)
+        return self.export(self.stdout, jobs, format, chunk_size, header=True)
+
+    def export(self, stream, jobs, format, chunk_size, header):
+        # every model to the same stream, a single csv header
+        results = {}
+        for key, filters in jobs:
+            results[key] = export(stream, format, chunk_size, header=header, **filters)
+            header = False
+        return results
@@ -0,0 +1,69 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from ...changes import get_indexed_models, index_logs
+
+
+class Command(BaseCommand):
+    help = "Build the changed fields index of the logs of the models registered with index_changes=True."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model",
+            action="append",
+            default=[],
+            help="Index only the logs of this model (app_label.model_name), can be repeated.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Logs indexed in each transaction.")
+        parser.add_argument("--start-after", type=int, help="Resume after this log pk.")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to use.")
+
+    def handle(self, *args, **options):
+        try:
+            models = [apps.get_model(label) for label in options["model"]]
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+        indexed_models = get_indexed_models()
+        for model in models:
+            if model not in indexed_models:
+                raise CommandError(f"Model {model._meta.label_lower} is not registered with index_changes=True.")
+        if not models:
+            models = indexed_models
+        if not models:
+            raise CommandError("No model is registered with index_changes=True.")
+
+        total = 0
+        for last, count in index_logs(
+            models,
+            chunk_size=options["chunk_size"],
+            start_after=options["start_after"],
+            using=options["database"],
+        ):
+            total += count
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Processed up to log {last}, {count} fields indexed.")
+        if options["verbosity"] > 0:
+            self.stdout.write(f"{total} changed fields indexed.")
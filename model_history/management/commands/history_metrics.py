@@ -0,0 +1,72 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...metrics import EVENTS, get_collectors
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the aggregated history metrics of the collectors in the MODEL_HISTORY_COLLECTORS setting "
+        "(collectors shared between processes, like model_history.metrics.CacheCollector)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the aggregates as JSON.")
+        parser.add_argument("--reset", action="store_true", help="Reset the aggregates after printing them.")
+
+    def handle(self, *args, **options):
+        collectors = [collector for collector in get_collectors() if hasattr(collector, "aggregates")]
+        if not collectors:
+            raise CommandError("No collector with aggregates in the MODEL_HISTORY_COLLECTORS setting.")
+
+        for collector in collectors:
+            aggregates = collector.aggregates()
+            if options["json"]:
+                self.stdout.write(json.dumps(aggregates, indent=2, sort_keys=True))
+            else:
+                self.print_table(aggregates)
+            if options["reset"]:
+                collector.reset()
+
+    def print_table(self, aggregates):
+        row = "{:<30} {:<10} {:>10} {:>12} {:>10} {:>12}"
+        self.stdout.write(row.format("model", "event", "count", "avg ms", "avg queries", "avg bytes"))
+        for model, events in sorted(aggregates.items()):
+            for event in EVENTS:
+                stats = events.get(event)
+                if not stats or not stats["count"]:
+                    continue
+                count = stats["count"]
+                self.stdout.write(
+                    row.format(
+                        model,
+                        event,
+                        count,
+                        f"{stats['time'] * 1000 / count:.3f}",
+                        f"{stats['queries'] / count:.1f}",
+                        f"{stats['bytes'] / count:.0f}",
+                    )
+                )
@@ -0,0 +1,62 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from ...partitioning import INTERVALS, create_partitions, drop_partitions, get_bounds, get_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = "Create the future partitions of the HistoryLog table, and drop the old ones (PostgreSQL only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ahead", type=int, default=3, help="Number of future partitions to create.")
+        parser.add_argument("--interval", choices=INTERVALS, help="Partition interval, by default the current one.")
+        parser.add_argument(
+            "--drop-older-than", type=float, help="Drop the partitions ending more than this number of days ago."
+        )
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to use.")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if not is_partitioned(connection):
+            raise CommandError("HistoryLog is not partitioned, use history_retention to delete old logs.")
+
+        partitions = get_partitions(connection)
+        interval = options["interval"] or (partitions[-1][3] if partitions else "month")
+        now = timezone.now()
+        end = now
+        for n in range(options["ahead"]):
+            end = get_bounds(end, interval)[1]
+        for name in create_partitions(connection, now, end, interval):
+            if options["verbosity"] > 0:
+                self.stdout.write(f"Created partition {name}.")
+
+        if options["drop_older_than"] is not None:
+            before = now - datetime.timedelta(days=options["drop_older_than"])
+            for name in drop_partitions(before, using=options["database"]):
+                if options["verbosity"] > 0:
+                    self.stdout.write(f"Dropped partition {name}.")
@@ -0,0 +1,83 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from ...retention import RetentionPolicy, get_policies
+
+
+class Command(BaseCommand):
+    help = "Delete old history logs, following the MODEL_HISTORY_RETENTION setting or the given policy."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", help="Only process this model (app_label.model_name).")
+        parser.add_argument("--keep-last", type=int, help="Keep the last N versions.")
+        parser.add_argument("--max-age", type=float, help="Drop versions older than this number of days.")
+        parser.add_argument(
+            "--squash", action="store_true", help="Keep the dropped versions as a single consolidated snapshot."
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Histories processed in each batch.")
+        parser.add_argument("--chunk-size", type=int, default=10000, help="Primary key range of each delete.")
+        parser.add_argument("--sleep", type=float, default=0, help="Seconds to wait between batches.")
+        parser.add_argument("--start-after", type=int, help="Resume after this history pk (requires --model).")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database to use.")
+
+    def handle(self, *args, **options):
+        if options["keep_last"] is not None or options["max_age"] is not None:
+            if not options["model"]:
+                raise CommandError("--model is required with --keep-last and --max-age.")
+            try:
+                policies = [
+                    RetentionPolicy(
+                        apps.get_model(options["model"]),
+                        keep_last=options["keep_last"],
+                        max_age=options["max_age"],
+                        squash=options["squash"],
+                    )
+                ]
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+        else:
+            policies = get_policies()
+            if options["model"]:
+                policies = [policy for policy in policies if policy.model._meta.label_lower == options["model"].lower()]
+        if options["start_after"] is not None and len(policies) != 1:
+            raise CommandError("--start-after requires a single policy.")
+
+        for policy in policies:
+            label = policy.model._meta.label_lower
+            total_deleted = total_reclaimed = 0
+            for last, deleted, reclaimed in policy.apply(
+                batch_size=options["batch_size"],
+                chunk_size=options["chunk_size"],
+                sleep=options["sleep"],
+                start_after=options["start_after"],
+                using=options["database"],
+            ):
+                total_deleted += deleted
+                total_reclaimed += reclaimed
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{label}: processed up to history {last}, {deleted} logs deleted.")
+            if options["verbosity"] > 0:
+                self.stdout.write(f"{label}: {total_deleted} logs deleted, {total_reclaimed} bytes reclaimed.")
@@ -0,0 +1,92 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+from itertools import islice
+
+from django.db import models, transaction
+
+__all__ = ["LoggedManager", "LoggedQuerySet", "LoggedQuerySetMixin"]
+
+
+class LoggedQuerySetMixin:
+    """
+    Log the changes made by bulk_create(), bulk_update() and update() on registered models.
+
+    Changed rows are reloaded in chunks, with their many to many relations prefetched,
+    and logged with a few queries for each chunk.
+    """
+
+    history_chunk_size = 1000
+
+    def _get_history_callback(self):
+        from .models import History
+
+        return History._registry.get(self.model)
+
+    def _log_history(self, pks, chunk_size=None):
+        callback = self._get_history_callback()
+        if callback is None:
+            return
+        chunk_size = chunk_size or self.history_chunk_size
+        queryset = self.model._base_manager.using(self.db).prefetch_related(
+            *[field.name for field in self.model._meta.many_to_many]
+        )
+        pks = iter(pks)
+        while chunk := list(islice(pks, chunk_size)):
+            callback.log_many(list(queryset.filter(pk__in=chunk)), using=self.db)
+
+    def bulk_create(self, objs, batch_size=None, *args, **kwargs):
+        if self._get_history_callback() is None:
+            return super().bulk_create(objs, batch_size, *args, **kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, batch_size, *args, **kwargs)
+            # objects without pk (backend does not return them) cannot be logged
+            self._log_history([obj.pk for obj in objs if obj.pk is not None], chunk_size=batch_size)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if self._get_history_callback() is None:
+            return super().bulk_update(objs, fields, batch_size)
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = list(objs)
+            rows = super().bulk_update(objs, fields, batch_size)
+            self._log_history([obj.pk for obj in objs], chunk_size=batch_size)
+        return rows
+
+    def update(self, **kwargs):
+        if self._get_history_callback() is None:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            pks = list(self.values_list("pk", flat=True))
+            rows = super().update(**kwargs)
+            self._log_history(pks)
+        return rows
+
+    update.alters_data = True
+
+
+class LoggedQuerySet(LoggedQuerySetMixin, models.QuerySet):
+    pass
+
+
+class LoggedManager(models.Manager.from_queryset(LoggedQuerySet)):
+    pass
@@ -0,0 +1,262 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import defaultdict
+from time import perf_counter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+__all__ = ["EVENTS", "CacheCollector", "MemoryCollector", "get_collectors", "measure", "measure_many", "record"]
+
+# log: the whole post_save/pre_delete handler
+# fetch, serialize, diff, write: the steps of a log
+# skip: a save which did not change any logged field
+# hit, miss: a timeline read from the timeline cache, or loaded from the database
+EVENTS = ["log", "fetch", "serialize", "diff", "write", "skip", "hit", "miss"]
+STATS = ["count", "time", "queries", "bytes"]
+
+
+class MemoryCollector:
+    """
+    In-process collector, aggregating the events of every model in memory.
+
+    Use it as a context manager to collect the events of a block of code, e.g. in tests:
+
+        with MemoryCollector() as collector:
+            user.save()
+        collector.aggregates()["auth.user"]["write"]["queries"]
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def __enter__(self):
+        add_collector(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        remove_collector(self)
+
+    def record(self, model, event, time=0.0, queries=0, size=0):
+        with self.lock:
+            stats = self.stats[model][event]
+            stats["count"] += 1
+            stats["time"] += time
+            stats["queries"] += queries
+            stats["bytes"] += size
+
+    def aggregates(self):
+        """
+        return {model: {event: {"count", "time" (seconds), "queries", "bytes"}}}
+        """
+        with self.lock:
+            return {
+                model: {event: dict(stats) for event, stats in events.items()} for model, events in self.stats.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.stats = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(STATS, 0)))
+
+
+class CacheCollector:
+    """
+    Collector aggregating the events of every process in a Django cache, so `history_metrics` can print them.
+
+    Counters are updated with `cache.incr()`, which is atomic on memcached and redis.
+    """
+
+    def __init__(self, alias=None, prefix="model_history:metrics"):
+        self.alias = alias or getattr(settings, "MODEL_HISTORY_METRICS_CACHE", "default")
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def get_key(self, model, event, stat):
+        return f"{self.prefix}:{model}:{event}:{stat}"
+
+    def record(self, model, event, time=0.0, queries=0, size=0):
+        # time is stored in microseconds, counters must be integers
+        values = {"count": 1, "time": int(time * 1_000_000), "queries": queries, "bytes": size}
+        for stat, value in values.items():
+            if value:
+                key = self.get_key(model, event, stat)
+                self.cache.add(key, 0, timeout=None)
+                self.cache.incr(key, value)
+
+    def get_keys(self):
+        from .models import History
+
+        return {
+            self.get_key(model._meta.label_lower, event, stat): (model._meta.label_lower, event, stat)
+            for model in History._registry
+            for event in EVENTS
+            for stat in STATS
+        }
+
+    def aggregates(self):
+        """
+        return {model: {event: {"count", "time" (seconds), "queries", "bytes"}}} for the registered models
+        """
+        keys = self.get_keys()
+        results = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(STATS, 0)))
+        for key, value in self.cache.get_many(keys).items():
+            model, event, stat = keys[key]
+            results[model][event][stat] = value / 1_000_000 if stat == "time" else value
+        return {model: dict(events) for model, events in results.items()}
+
+    def reset(self):
+        self.cache.delete_many(self.get_keys())
+
+
+_collectors = None
+_collectors_lock = threading.RLock()
+
+
+def get_collectors():
+    """
+    return the collectors of the MODEL_HISTORY_COLLECTORS setting (a list of dotted paths), plus the added ones
+    """
+    global _collectors
+    if _collectors is None:
+        with _collectors_lock:
+            if _collectors is None:
+                _collectors = [import_string(path)() for path in getattr(settings, "MODEL_HISTORY_COLLECTORS", [])]
+    return _collectors
+
+
+def add_collector(collector):
+    global _collectors
+    with _collectors_lock:
+        _collectors = [*get_collectors(), collector]
+
+
+def remove_collector(collector):
+    global _collectors
+    with _collectors_lock:
+        _collectors = [item for item in get_collectors() if item is not collector]
+
+
+def reset_collectors(*, setting, **kwargs):
+    global _collectors
+    if setting == "MODEL_HISTORY_COLLECTORS":
+        _collectors = None
+
+
+setting_changed.connect(reset_collectors)
+
+
+def get_label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def record(model, event, time=0.0, queries=0, size=0):
+    """
+    record an event of a model (a model class or an "app_label.model" label)
+    """
+    for collector in get_collectors():
+        collector.record(get_label(model), event, time=time, queries=queries, size=size)
+
+
+class NullMeasure:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def snapshot(self, fields):
+        pass
+
+
+NULL_MEASURE = NullMeasure()
+
+
+class Measure:
+    def __init__(self, weights, event, using):
+        self.weights = weights
+        self.event = event
+        self.using = using
+        self.queries = 0
+        self.size = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.wrapper = connections[self.using].execute_wrapper(self)
+        self.wrapper.__enter__()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self.start
+        self.wrapper.__exit__(*exc_info)
+        total = sum(self.weights.values())
+        for model, weight in self.weights.items():
+            share = weight / total
+            record(
+                model,
+                self.event,
+                time=elapsed * share,
+                queries=round(self.queries * share),
+                size=round(self.size * share),
+            )
+
+    def snapshot(self, fields):
+        self.size += len(json.dumps(fields, cls=DjangoJSONEncoder))
+
+
+def measure(model, event, using=None):
+    """
+    return a context manager recording the time and the queries of its block,
+    and the size of the snapshots passed to its `snapshot()` method
+
+    without collectors it does nothing
+    """
+    if not get_collectors():
+        return NULL_MEASURE
+    return Measure({model: 1}, event, using or DEFAULT_DB_ALIAS)
+
+
+def measure_many(weights, event, using=None):
+    """
+    like `measure()`, for a block working on many models at once
+
+    weights maps every model to its share of the work (e.g. the number of its logs),
+    the recorded time, queries and size are split accordingly
+    """
+    if not get_collectors() or not weights:
+        return NULL_MEASURE
+    return Measure(weights, event, using or DEFAULT_DB_ALIAS)
@@ -0,0 +1,60 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def update_heads(apps, schema_editor):
+    History = apps.get_model("model_history", "History")
+    HistoryLog = apps.get_model("model_history", "HistoryLog")
+    db_alias = schema_editor.connection.alias
+    last_log = HistoryLog.objects.filter(history=models.OuterRef("pk")).order_by("-created_at", "-pk")
+    History.objects.using(db_alias).update(head=models.Subquery(last_log.values("pk")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("model_history", "0002_historyoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="history",
+            name="head",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="model_history.historylog",
+                verbose_name="last log",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="historylog",
+            index=models.Index(fields=["history", "created_at"], name="historylog_history_created_idx"),
+        ),
+        migrations.RunPython(update_heads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+import model_history.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("model_history", "0003_history_head"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="history",
+            name="deltas",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="deltas since last keyframe"),
+        ),
+        migrations.AddField(
+            model_name="history",
+            name="snapshot",
+            field=model_history.fields.JSONField(
+                blank=True,
+                default=None,
+                editable=False,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+                null=True,
+                verbose_name="current fields",
+            ),
+        ),
+        migrations.AddField(
+            model_name="historylog",
+            name="delta",
+            field=models.BooleanField(
+                default=False, help_text="fields stores only the changes from the previous log", verbose_name="delta"
+            ),
+        ),
+    ]
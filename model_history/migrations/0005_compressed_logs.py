@@ -0,0 +1,50 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import django.core.serializers.json
+from django.db import migrations
+
+import model_history.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("model_history", "0004_delta_storage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="historylog",
+            name="fields",
+            field=model_history.fields.CompressedJSONField(
+                default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name="fields"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="historylog",
+            name="updated",
+            field=model_history.fields.CompressedJSONField(
+                default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name="updated fields"
+            ),
+        ),
+    ]
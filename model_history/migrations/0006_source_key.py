@@ -0,0 +1,81 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+def fill_source_keys(apps, schema_editor):
+    History = apps.get_model("model_history", "History")
+    db_alias = schema_editor.connection.alias
+    History.objects.using(db_alias).update(source_key=Cast("source_id", models.CharField(max_length=255)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("model_history", "0005_compressed_logs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="history",
+            name="source_key",
+            field=models.CharField(
+                default="",
+                help_text="the primary key of the source, as a string",
+                max_length=255,
+                verbose_name="source key",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_source_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="history",
+            name="source_id",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="set only for integer primary keys",
+                null=True,
+                verbose_name="source id",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="history",
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name="history",
+            constraint=models.UniqueConstraint(fields=("source_key", "source_type"), name="history_source_unique"),
+        ),
+        migrations.AlterField(
+            model_name="historyoutbox",
+            name="source_id",
+            field=models.CharField(max_length=255, verbose_name="source key"),
+        ),
+        migrations.RenameField(
+            model_name="historyoutbox",
+            old_name="source_id",
+            new_name="source_key",
+        ),
+    ]
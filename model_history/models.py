@@ -20,24 +20,179 @@
 
 from __future__ import annotations
 
+import copy
+from collections import defaultdict
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models, transaction
-from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.db import connections, models, router, transaction
+from django.db.models.functions import Cast
+from django.db.models.signals import m2m_changed, post_init, post_save, pre_delete
+from django.utils import timezone
 from django.utils.translation import gettext, gettext_lazy as _
-from rest_framework import serializers
 
 from . import fields as _fields
+from .batch import schedule, schedule_relations
+from .cache import aget_timeline, get_timeline, get_timeline_cache
 from .exceptions import HistoryAlreadyRegisteredException
+from .metrics import measure, measure_many, record
+from .outbox import get_outbox
+from .snapshots import ENGINES, build_drf_serializer_class, build_native_serializer_class, get_default_engine
+
+
+def get_source_key(pk):
+    """
+    return the normalized History.source_key of a primary key
+    """
+    return str(pk)
 
 
 class Callback:
-    def __init__(self, exclude=None):
+    def __init__(
+        self,
+        exclude=None,
+        serializer_class=None,
+        batch=False,
+        outbox=False,
+        keyframe_interval=None,
+        tracked_fields=None,
+        engine=None,
+        index_changes=False,
+    ):
         self.exclude = exclude
+        self.engine = engine
+        self.serializer_class = serializer_class
+        self.batch = batch
+        self.outbox = outbox
+        self.keyframe_interval = keyframe_interval
+        self.index_changes = index_changes
+        # tracked field name -> attname, None to disable tracking
+        self.tracked_fields = tracked_fields
+        # many to many through model -> field
+        self.relations = {}
+
+    def __call__(self, instance, signal=None, using=None, **kwargs):
+        if signal is post_save and not self.has_changed(instance, kwargs.get("created"), kwargs.get("update_fields")):
+            record(type(instance), "skip")
+            return
+        using = using or router.db_for_write(type(instance), instance=instance)
+        with measure(type(instance), "log", using):
+            if self.batch:
+                schedule(instance, self, using=using, deleted=signal is pre_delete)
+            elif self.outbox:
+                self.enqueue(instance, using=using)
+            else:
+                History.objects.log(instance, exclude=self.exclude, serializer_class=self.serializer_class)
+        if signal is post_save and self.tracked_fields is not None:
+            self.set_state(instance, using)
+
+    def get_state(self, instance):
+        state = {}
+        for attname in self.tracked_fields.values():
+            if attname in instance.__dict__:
+                value = instance.__dict__[attname]
+                state[attname] = copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        return state
+
+    def post_init(self, instance, **kwargs):
+        instance._history_state = self.get_state(instance)
+
+    def set_state(self, instance, using):
+        """
+        record the tracked fields of a logged instance when its transaction commits
+
+        a save rolled back and retried is still compared with the state before it
+        """
+        state = self.get_state(instance)
+        transaction.on_commit(lambda: setattr(instance, "_history_state", state), using=using)
+
+    def has_changed(self, instance, created, update_fields):
+        """
+        compare the tracked fields with the values they had when the instance was loaded or last committed
+        """
+        if self.tracked_fields is None:
+            return True
+        if not created and update_fields is not None:
+            # update_fields can hold field names or attnames (e.g. "owner_id")
+            update_fields = set(update_fields)
+            if self.tracked_fields.keys().isdisjoint(update_fields) and update_fields.isdisjoint(
+                self.tracked_fields.values()
+            ):
+                return False
+        return created or self.get_state(instance) != instance.__dict__.get("_history_state")
 
-    def __call__(self, instance, **kwargs):
-        History.objects.log(instance, exclude=self.exclude)
+    def m2m_changed(self, sender, instance, action, reverse, model, pk_set, using, **kwargs):
+        """
+        coalesce the many to many changes in a transaction into a single log
+
+        only the changed pks are recorded, and applied to the last logged snapshot at commit
+        """
+        field = self.relations.get(sender)
+        if field is None or field.name in (self.exclude or ()):
+            return
+        if not reverse:
+            if action in ("post_add", "post_remove", "post_clear"):
+                if self.outbox:
+                    self.enqueue(instance, using=using)
+                else:
+                    schedule_relations(type(instance), [instance.pk], self, field.name, action, pk_set, using, instance)
+            return
+
+        # instance is on the other side of the relation, pk_set holds the registered model pks
+        if action == "pre_clear":
+            instance._history_cleared = list(
+                sender._base_manager.using(using)
+                .filter(**{field.m2m_reverse_field_name(): instance.pk})
+                .values_list(field.m2m_field_name(), flat=True)
+            )
+            return
+        if action == "post_clear":
+            action, pk_set = "post_remove", instance.__dict__.pop("_history_cleared", [])
+        elif action not in ("post_add", "post_remove"):
+            return
+        if self.outbox:
+            for source in model._base_manager.using(using).filter(pk__in=pk_set):
+                self.enqueue(source, using=using)
+        else:
+            schedule_relations(model, pk_set, self, field.name, action, [instance.pk], using)
+
+    def log_many(self, instances, using):
+        """
+        log many instances at once, honouring the registration mode
+        """
+        if self.batch:
+            for instance in instances:
+                schedule(instance, self, using=using)
+        elif self.outbox:
+            for instance in instances:
+                self.enqueue(instance, using=using)
+        else:
+            History.objects.db_manager(using)._log_snapshots(
+                [(type(instance), instance.pk, self.serialize(instance), str(instance)) for instance in instances]
+            )
+
+    def enqueue(self, instance, using):
+        entry = HistoryOutbox(
+            source_type=ContentType.objects.db_manager(using).get_for_model(instance),
+            source_key=get_source_key(instance.pk),
+            label=str(instance),
+            fields=self.serialize(instance),
+        )
+        get_outbox().put(entry, using=using)
+
+    def serialize(self, instance):
+        serializer_class = self.serializer_class
+        if serializer_class is None:
+            serializer_class = History.build_serializer_class(
+                type(instance), exclude_opt=self.exclude, engine=self.engine
+            )
+        with measure(type(instance), "serialize", instance._state.db) as measured:
+            data = serializer_class(instance).data
+            measured.snapshot(data)
+        return data
 
 
 class TimestampModel(models.Model):
@@ -54,19 +209,139 @@ class TimestampModel(models.Model):
 
 class HistoryQuerySet(models.QuerySet):
     def fetch(self, instance):
-        source_type = ContentType.objects.get_for_model(instance)
-        source_id = instance.pk
-        try:
-            history = self.get(source_type=source_type, source_id=source_id)
-        except History.DoesNotExist:
-            history = self.model(
-                source_type=source_type,
-                source_id=source_id,
-                app_label=source_type.app_label,
-                model=source_type.model,
-            )
+        """
+        return the history of an instance, with a single query
+
+        the instance and its content type are cached on the history, so logging it does not load them again
+        """
+        with measure(type(instance), "fetch", self.db):
+            source_type = ContentType.objects.get_for_model(instance)
+            try:
+                history = self.select_related("head").get(
+                    source_type=source_type, source_key=get_source_key(instance.pk)
+                )
+            except History.DoesNotExist:
+                history = self.model.for_source(source_type, instance.pk)
+            else:
+                history.source_type = source_type
+        self.model.source.set_cached_value(history, instance)
         return history
 
+    async def afetch(self, instance):
+        """
+        async version of `fetch()`
+        """
+        return await sync_to_async(self.fetch)(instance)
+
+    def fetch_many(self, instances, create=False):
+        """
+        return the histories of many instances, in the same order, with a query for each content type
+
+        missing histories are unsaved like in `fetch()`, with `create=True` they are saved with a bulk insert
+        which ignores the conflicts with concurrent inserts where supported
+        """
+        content_types = ContentType.objects.db_manager(self.db)
+        by_type = defaultdict(dict)
+        for instance in instances:
+            by_type[content_types.get_for_model(instance)][instance.pk] = str(instance)
+        histories = {}
+        for source_type, labels in by_type.items():
+            for pk, history in self._fetch_many(source_type, labels, create).items():
+                histories[source_type.pk, pk] = history
+        return [histories[content_types.get_for_model(instance).pk, instance.pk] for instance in instances]
+
+    def _fetch_many(self, source_type, labels, create):
+        """
+        return {pk: history} for the pk -> label mapping of a content type
+        """
+        with measure(f"{source_type.app_label}.{source_type.model}", "fetch", self.db):
+            pks = {get_source_key(pk): pk for pk in labels}
+            histories = {
+                history.source_key: history
+                for history in self.select_related("head").filter(source_type=source_type, source_key__in=pks)
+            }
+            missing = [
+                self.model.for_source(source_type, pk, label=label)
+                for pk, label in labels.items()
+                if get_source_key(pk) not in histories
+            ]
+            if missing and create:
+                ignore_conflicts = connections[self.db].features.supports_ignore_conflicts
+                self.bulk_create(missing, ignore_conflicts=ignore_conflicts)
+                if ignore_conflicts or any(history.pk is None for history in missing):
+                    # primary keys are not returned, and a concurrent insert may have logged already
+                    missing = self.select_related("head").filter(
+                        source_type=source_type,
+                        source_key__in=[history.source_key for history in missing],
+                    )
+            histories.update((history.source_key, history) for history in missing)
+            for history in histories.values():
+                history.source_type = source_type
+        return {pks[key]: history for key, history in histories.items()}
+
+    def update_heads(self):
+        """
+        point every history to its last log
+        """
+        last_log = HistoryLog.objects.filter(history=models.OuterRef("pk")).order_by("-created_at", "-pk")
+        return self.update(head=models.Subquery(last_log.values("pk")[:1]))
+
+    def as_of(self, model_or_queryset, timestamp, chunk_size=2000):
+        """
+        yield (pk, fields) with the last logged fields at `timestamp` of every source of a model or queryset
+
+        the last log of every source is selected with DISTINCT ON where supported, otherwise with a correlated
+        subquery; delta logs are rebuilt replaying the logs from their keyframe, with a query for each chunk
+        """
+        if isinstance(model_or_queryset, models.QuerySet):
+            model, queryset = model_or_queryset.model, model_or_queryset
+        else:
+            model, queryset = model_or_queryset, None
+        source_type = ContentType.objects.db_manager(self.db).get_for_model(model)
+        columns = ["history_id", "created_at", "fields", "updated", "delta"]
+
+        logs = HistoryLog.objects.using(self.db).filter(history__source_type=source_type, created_at__lte=timestamp)
+        if queryset is not None:
+            if isinstance(model._meta.pk, (models.IntegerField, models.CharField)):
+                keys = queryset.values(key=Cast("pk", models.CharField(max_length=255)))
+            else:
+                # the database representation may differ from the normalized key
+                keys = [get_source_key(pk) for pk in queryset.values_list("pk", flat=True)]
+            logs = logs.filter(history__source_key__in=keys)
+        if connections[self.db].features.can_distinct_on_fields:
+            latest = logs.order_by("history_id", "-created_at", "-pk").distinct("history_id")
+        else:
+            last_log = HistoryLog.objects.filter(history=models.OuterRef("history"), created_at__lte=timestamp)
+            latest = logs.filter(
+                pk=models.Subquery(last_log.order_by("-created_at", "-pk").values("pk")[:1]),
+            ).order_by("history_id")
+        latest = latest.annotate(source_key=models.F("history__source_key")).only(*columns)
+
+        keyframes = HistoryLog.objects.filter(
+            history=models.OuterRef("history"), delta=False, created_at__lte=timestamp
+        )
+        logs = latest.iterator(chunk_size=chunk_size)
+        while chunk := list(islice(logs, chunk_size)):
+            fields = {log.history_id: log.fields for log in chunk if not log.delta}
+            deltas = [log.history_id for log in chunk if log.delta]
+            if deltas:
+                chain = (
+                    HistoryLog.objects.using(self.db)
+                    .filter(
+                        history_id__in=deltas,
+                        created_at__lte=timestamp,
+                        created_at__gte=models.Subquery(
+                            keyframes.order_by("-created_at", "-pk").values("created_at")[:1]
+                        ),
+                    )
+                    .order_by("history_id", "created_at", "pk")
+                    .only(*columns)
+                )
+                for log in chain:
+                    fields[log.history_id] = log.apply(fields.get(log.history_id))
+            for log in chunk:
+                yield model._meta.pk.to_python(log.source_key), fields[log.history_id]
+
 
 class HistoryManager(models.Manager.from_queryset(HistoryQuerySet)):
     def log(self, instance, exclude=None, serializer_class=None):
@@ -74,6 +349,91 @@ class HistoryManager(models.Manager.from_queryset(HistoryQuerySet)):
         history.save(exclude=exclude, serializer_class=serializer_class)
         return history
 
+    async def alog(self, instance, exclude=None, serializer_class=None):
+        """
+        async version of `log()`
+
+        the lookup, the serialization and the writes run in a single thread hop,
+        as the transaction of the writes cannot span awaits
+        """
+        return await sync_to_async(self.log)(instance, exclude=exclude, serializer_class=serializer_class)
+
+    def log_many(self, instances, exclude=None, serializer_class=None):
+        """
+        log many instances at once, like `log()` does for each of them, return the new logs
+
+        histories are fetched (and the missing ones created) with a couple of queries for each content type,
+        and the logs are saved with a bulk insert
+        """
+        snapshots = []
+        for instance in instances:
+            model = type(instance)
+            instance_serializer_class = serializer_class
+            if instance_serializer_class is None:
+                engine = getattr(self.model._registry.get(model), "engine", None)
+                instance_serializer_class = self.model.build_serializer_class(model, exclude_opt=exclude, engine=engine)
+            with measure(model, "serialize", self.db) as measured:
+                data = instance_serializer_class(instance).data
+                measured.snapshot(data)
+            snapshots.append((model, instance.pk, data, str(instance)))
+        return self._log_snapshots(snapshots)
+
+    async def alog_many(self, instances, exclude=None, serializer_class=None):
+        """
+        async version of `log_many()`, in a single thread hop like `alog()`
+        """
+        return await sync_to_async(self.log_many)(instances, exclude=exclude, serializer_class=serializer_class)
+
+    def _log_snapshots(self, snapshots):
+        """
+        log many (model, pk, fields, label) snapshots at once, at most one for each instance
+
+        it does a couple of queries for each content type, plus a bulk update and a bulk insert
+        """
+        content_types = ContentType.objects.db_manager(self.db)
+        by_type = defaultdict(dict)
+        for model, pk, current_fields, label in snapshots:
+            by_type[content_types.get_for_model(model)][pk] = (current_fields, label)
+
+        now = timezone.now()
+        histories, logs = [], []
+        with transaction.atomic(using=self.db):
+            for source_type, entries in by_type.items():
+                labels = {pk: label for pk, (current_fields, label) in entries.items()}
+                for pk, history in self.get_queryset()._fetch_many(source_type, labels, create=True).items():
+                    log = history.build_log(*entries[pk])
+                    if log is not None:
+                        history.last_modified_at = now
+                        histories.append(history)
+                        logs.append(log)
+
+            if logs:
+                weights = defaultdict(int)
+                for history in histories:
+                    weights[f"{history.app_label}.{history.model}"] += 1
+                with measure_many(weights, "write", self.db):
+                    HistoryLog.objects.using(self.db).bulk_create(logs)
+                    for history, log in zip(histories, logs):
+                        history.head = log
+                    if any(log.pk is None for log in logs):
+                        # backend cannot return the primary keys of the inserted rows
+                        self.bulk_update(histories, ["label", "last_modified_at", "snapshot", "deltas"])
+                        updated = self.filter(pk__in=[history.pk for history in histories])
+                        updated.update_heads()
+                        heads = dict(updated.values_list("pk", "head_id"))
+                        for history, log in zip(histories, logs):
+                            log.pk = heads[history.pk]
+                    else:
+                        self.bulk_update(histories, ["label", "last_modified_at", "head", "snapshot", "deltas"])
+                    indexed = [
+                        log
+                        for history, log in zip(histories, logs)
+                        if log.updated and getattr(history.get_callback(), "index_changes", False)
+                    ]
+                    if indexed:
+                        HistoryChangedField.objects.db_manager(self.db).index(indexed)
+        return logs
+
 
 class History(TimestampModel):
     AlreadyRegistered = HistoryAlreadyRegisteredException
@@ -96,69 +456,284 @@ class History(TimestampModel):
         verbose_name=_("source content type"),
     )
     source_id = models.PositiveIntegerField(
+        blank=True,
+        null=True,
         verbose_name=_("source id"),
+        help_text=_("set only for integer primary keys"),
+    )
+    source_key = models.CharField(
+        max_length=255,
+        verbose_name=_("source key"),
+        help_text=_("the primary key of the source, as a string"),
     )
     source = GenericForeignKey(
         "source_type",
-        "source_id",
+        "source_key",
+    )
+    head = models.ForeignKey(
+        "HistoryLog",
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name=_("last log"),
+    )
+    snapshot = _fields.JSONField(
+        blank=True,
+        null=True,
+        default=None,
+        editable=False,
+        encoder=DjangoJSONEncoder,
+        verbose_name=_("current fields"),
+    )
+    deltas = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_("deltas since last keyframe"),
     )
 
     objects = HistoryManager()
 
     class Meta:
-        unique_together = ["app_label", "model", "source_id"]
+        constraints = [
+            # source_key first, so the index serves lookups by key alone too
+            models.UniqueConstraint(fields=["source_key", "source_type"], name="history_source_unique"),
+        ]
         verbose_name = _("History")
         verbose_name_plural = _("Histories")
 
     def __str__(self):
-        return f"{self.label} [{self.app_label}.{self.model} {self.source_id}]"
+        return f"{self.label} [{self.app_label}.{self.model} {self.source_key}]"
 
-    @transaction.atomic
     def save(self, fields=None, exclude=None, serializer_class=None, *args, **kwargs):
         """
         History acts as a singleton, cannot be updated other than last_modified_at field
+
+        the source is serialized from the instance cached by `fetch()`, else it is loaded from the database
         """
-        save_first_time = not self.id
         serializer_class = self.get_serializer_class(fields, exclude) if serializer_class is None else serializer_class
+        source = self.source
+        with measure(type(source), "serialize", self._state.db) as measured:
+            data = serializer_class(source).data
+            measured.snapshot(data)
+        self.add_log(data, str(source), *args, **kwargs)
 
-        current_fields = serializer_class(self.source).data
+    def add_log(self, current_fields, label, *args, using=None, **kwargs):
+        """
+        save a new log if current_fields differ from the last logged ones
 
-        if save_first_time:
-            # save app_label and model
-            self.app_label = self.source_type.app_label
-            self.model = self.source_type.model
-            super().save(*args, **kwargs)
+        the history and the log are written to `using`, else to the database the history was loaded from,
+        like `Model.save()` no savepoint is created, an error rolls back the enclosing transaction
+        """
+        using = using or self._state.db or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            inserted = not self.id
+            if inserted:
+                # save app_label and model
+                self.app_label = self.source_type.app_label
+                self.model = self.source_type.model
+                self.insert(using=using)
 
-        try:
-            prev_fields = self.logs.order_by("created_at").last().fields
-        except AttributeError:
-            save_first_time, updated_fields = True, {}
+            log = self.build_log(current_fields, label)
+            if log is not None:
+                with measure(f"{self.app_label}.{self.model}", "write", using):
+                    log.save(*args, using=using, **kwargs)
+                    previous_head_id, self.head = self.head_id, log
+                    if inserted and not self.save_first_head(using):
+                        # the insert adopted the row of a concurrent first log, diff with its last log instead
+                        log.delete(using=using)
+                        self.refresh_from_db(using=using, fields=["label", "head", "snapshot", "deltas"])
+                        return self.add_log(current_fields, label, *args, using=using, **kwargs)
+                    if not inserted:
+                        super().save(
+                            using=using, update_fields=["label", "last_modified_at", "head", "snapshot", "deltas"]
+                        )
+                    if log.updated and getattr(self.get_callback(), "index_changes", False):
+                        HistoryChangedField.objects.db_manager(using).index([log])
+                if (timeline_cache := get_timeline_cache()) is not None:
+                    timeline_cache.append(self, previous_head_id, log, using=using)
+        return log
+
+    @classmethod
+    def for_source(cls, source_type, pk, **kwargs):
+        """
+        return a new unsaved history of the object of source_type with primary key pk
+        """
+        return cls(
+            source_type=source_type,
+            source_id=pk if isinstance(pk, int) and pk >= 0 else None,
+            source_key=get_source_key(pk),
+            app_label=source_type.app_label,
+            model=source_type.model,
+            **kwargs,
+        )
+
+    def insert(self, using=None):
+        """
+        insert a new history with an upsert on (source_type, source_key) where supported, in a single query
+
+        a concurrent first log of the same object does not fail, the history gets the primary key of its row
+        and `add_log()` diffs with the logs of the row when its first head update finds one already there
+        """
+        using = using or router.db_for_write(type(self), instance=self)
+        features = connections[using].features
+        manager = type(self).objects.db_manager(using)
+        if getattr(features, "supports_update_conflicts_with_target", False):
+            manager.bulk_create(
+                [self],
+                update_conflicts=True,
+                unique_fields=["source_type", "source_key"],
+                update_fields=["last_modified_at"],
+            )
+        elif getattr(features, "supports_update_conflicts", False):
+            manager.bulk_create([self], update_conflicts=True, update_fields=["last_modified_at"])
         else:
-            updated_fields = self.get_updated_fields(prev_fields, current_fields)
-
-        if save_first_time or updated_fields:
-            self.label = str(self.source)
-            super().save(update_fields=["label", "last_modified_at"])
-            log = HistoryLog(
-                history=self,
-                fields=current_fields,
-                updated=updated_fields,
+            super().save(using=using)
+        if self.pk is None:
+            # backend cannot return the primary key
+            self.pk = (
+                manager.filter(source_type=self.source_type, source_key=self.source_key)
+                .values_list("pk", flat=True)
+                .get()
+            )
+
+    def save_first_head(self, using):
+        """
+        point a just inserted history to its first log, return False if the row already had one
+        """
+        self.last_modified_at = timezone.now()
+        updated = (
+            type(self)
+            .objects.db_manager(using)
+            .filter(pk=self.pk, head=None)
+            .update(
                 label=self.label,
+                last_modified_at=self.last_modified_at,
+                head=self.head,
+                snapshot=self.snapshot,
+                deltas=self.deltas,
             )
-            log.save(*args, **kwargs)
+        )
+        return updated > 0
+
+    def build_log(self, current_fields, label):
+        """
+        return a new unsaved log if current_fields differ from the last logged ones
+
+        current_fields can be a callable, which gets the last logged fields (or None) and returns the current ones
+
+        when the model is registered with a `keyframe_interval` only every n-th log is a full snapshot (keyframe),
+        the others store only the changed fields, and the current snapshot is kept in `History.snapshot`
+        """
+        model = f"{self.app_label}.{self.model}"
+        with measure(model, "diff", self._state.db):
+            prev_fields = self.get_current_fields()
+            if callable(current_fields):
+                # a patch to the last logged fields
+                current_fields = current_fields(prev_fields)
+            if prev_fields is None:
+                updated_fields = {}
+            else:
+                updated_fields = self.get_updated_fields(prev_fields, current_fields)
+        if prev_fields is not None and not updated_fields:
+            record(model, "skip")
+            return None
+
+        log = HistoryLog(history=self, updated=updated_fields, label=label)
+        interval = self.get_keyframe_interval()
+        if self.head is not None and interval and self.deltas + 1 < interval:
+            log.fields, log.delta = self.get_delta_fields(prev_fields, current_fields), True
+            self.snapshot, self.deltas = current_fields, self.deltas + 1
+        else:
+            log.fields = current_fields
+            self.snapshot, self.deltas = None, 0
+        self.label = label
+        return log
+
+    def get_current_fields(self):
+        """
+        return the last logged snapshot
+
+        if the last log was dropped (see `model_history.partitioning`) its fields are kept in `snapshot`
+        """
+        if self.head is None:
+            return self.snapshot
+        return self.snapshot if self.head.delta else self.head.fields
+
+    def get_callback(self):
+        return self._registry.get(ContentType.objects.get_for_id(self.source_type_id).model_class())
+
+    def get_keyframe_interval(self):
+        return getattr(self.get_callback(), "keyframe_interval", None)
+
+    def get_timeline(self, size=20):
+        """
+        return (the last `size` logs, newest first, json columns deferred; the current snapshot),
+        read through the MODEL_HISTORY_TIMELINE_CACHE cache if it is configured
+        """
+        return get_timeline(self, size)
+
+    async def aget_timeline(self, size=20):
+        """
+        async version of `get_timeline()`, a cached timeline is read without any thread hop
+        where the cache backend supports async
+        """
+        return await aget_timeline(self, size)
+
+    def iter_snapshots(self):
+        """
+        yield (log, fields) for every log, rebuilding the full snapshots of delta logs
+        """
+        fields = None
+        for log in self.logs.order_by("created_at", "pk"):
+            fields = log.apply(fields)
+            yield log, fields
 
     def get_serializer_class(self, fields_opt=None, exclude_opt=None):
+        model_class = ContentType.objects.get_for_id(self.source_type_id).model_class()
+        engine = getattr(self._registry.get(model_class), "engine", None)
+        return self.build_serializer_class(model_class, fields_opt, exclude_opt, engine=engine)
+
+    _serializers = {}
+
+    @classmethod
+    def build_serializer_class(cls, model_class, fields_opt=None, exclude_opt=None, engine=None):
+        """
+        return a cached serializer class for (model_class, fields, exclude, engine)
+
+        the "drf" engine builds a rest framework ModelSerializer,
+        the "native" engine a lighter Snapshot reading the raw field values
+        """
         if not fields_opt and not exclude_opt:
             fields_opt = "__all__"
-        model_class = self.source_type.model_class()
+        if engine is None:
+            engine = get_default_engine()
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown snapshot engine {engine!r}.")
+        key = (
+            model_class,
+            fields_opt if isinstance(fields_opt, str) else tuple(fields_opt or ()),
+            tuple(exclude_opt or ()),
+            engine,
+        )
+        try:
+            return cls._serializers[key]
+        except KeyError:
+            pass
 
-        class ModelSerializer(serializers.ModelSerializer):
-            class Meta:
-                fields = fields_opt
-                exclude = exclude_opt
-                model = model_class
+        if engine == "drf":
+            serializer_class = build_drf_serializer_class(model_class, fields_opt, exclude_opt)
+        else:
+            serializer_class = build_native_serializer_class(model_class, fields_opt, exclude_opt)
+        cls._serializers[key] = serializer_class
+        return serializer_class
 
-        return ModelSerializer
+    def get_delta_fields(self, old_fields, new_fields):
+        """
+        get new values for updated and added fields
+        """
+        return {key: value for key, value in new_fields.items() if key not in old_fields or old_fields[key] != value}
 
     def get_updated_fields(self, old_fields, new_fields):
         """
@@ -176,33 +751,141 @@ class History(TimestampModel):
     _registry = {}
 
     @classmethod
-    def register(cls, sender, *, exclude=None):
+    def register(
+        cls,
+        sender,
+        *,
+        exclude=None,
+        batch=False,
+        outbox=False,
+        keyframe_interval=None,
+        track_changes=False,
+        engine=None,
+        index_changes=False,
+    ):
+        """
+        log sender changes
+
+        with `batch=True` changes are collected and logged once when the transaction commits,
+        with `outbox=True` snapshots are queued and logged later by the `history_worker` command,
+        with `keyframe_interval=n` only every n-th log stores a full snapshot, the others only the changes,
+        with `track_changes=True` saves which do not change any logged field are skipped before serialization,
+        `engine` selects how instances are serialized, "drf" (default if installed) or "native",
+        with `index_changes=True` the names of the changed fields of every log are indexed for `changed_field()`
+        """
+        if batch and outbox:
+            raise ValueError("batch and outbox options are mutually exclusive.")
         if (callback := cls._registry.get(sender)) is not None:
             raise History.AlreadyRegistered(
                 f"Model {sender._meta.app_label}.{sender._meta.model_name} was already registered."
             )
 
-        callback = Callback(exclude=exclude)
+        tracked_fields = None
+        if track_changes:
+            tracked_fields = {
+                field.name: field.attname for field in sender._meta.concrete_fields if field.name not in (exclude or ())
+            }
+        callback = Callback(
+            exclude=exclude,
+            serializer_class=cls.build_serializer_class(sender, exclude_opt=exclude, engine=engine),
+            engine=engine,
+            batch=batch,
+            outbox=outbox,
+            keyframe_interval=keyframe_interval,
+            tracked_fields=tracked_fields,
+            index_changes=index_changes,
+        )
         cls._registry[sender] = callback
+        if track_changes:
+            post_init.connect(callback.post_init, sender=sender)
         post_save.connect(callback, sender=sender)
         pre_delete.connect(callback, sender=sender)
-        m2m_changed.connect(callback, sender=sender)
+        for field in sender._meta.many_to_many:
+            callback.relations[field.remote_field.through] = field
+            m2m_changed.connect(callback.m2m_changed, sender=field.remote_field.through)
 
     @classmethod
     def unregister(cls, sender):
         callback = cls._registry.pop(sender, None)
         if callback is None:
             return
+        for key in [key for key in cls._serializers if key[0] is sender]:
+            del cls._serializers[key]
+        post_init.disconnect(receiver=callback.post_init, sender=sender)
         post_save.disconnect(receiver=callback, sender=sender)
         pre_delete.disconnect(receiver=callback, sender=sender)
-        m2m_changed.disconnect(receiver=callback, sender=sender)
+        for through in callback.relations:
+            m2m_changed.disconnect(receiver=callback.m2m_changed, sender=through)
 
 
 class HistoryLogQuerySet(models.QuerySet):
-    pass
+    def summaries(self):
+        """
+        defer the fields and updated json columns, for listings which need only timestamps and labels
+        """
+        return self.defer("fields", "updated")
+
+    def for_object(self, instance):
+        """
+        return the logs of an instance, json columns deferred, in timeline order
+        """
+        source_type = ContentType.objects.db_manager(self.db).get_for_model(instance)
+        return (
+            self.filter(history__source_type=source_type, history__source_key=get_source_key(instance.pk))
+            .summaries()
+            .order_by("created_at", "pk")
+        )
+
+    def between(self, start=None, end=None):
+        """
+        return the logs created in [start, end), json columns deferred; both bounds are optional
+        """
+        queryset = self.summaries()
+        if start is not None:
+            queryset = queryset.filter(created_at__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_at__lt=end)
+        return queryset
+
+    def page(self, after=None, size=100, reverse=False):
+        """
+        return the `size` logs following `after` (a log, or a (history_id, created_at, pk) tuple)
+        ordered by (history_id, created_at, pk), backwards with `reverse=True`
+
+        keyset pagination on the (history, created_at) index: every page costs the same, however deep
+        """
+        if reverse:
+            queryset = self.order_by("-history_id", "-created_at", "-pk")
+        else:
+            queryset = self.order_by("history_id", "created_at", "pk")
+        if after is not None:
+            if isinstance(after, HistoryLog):
+                after = (after.history_id, after.created_at, after.pk)
+            history_id, created_at, pk = after
+            op = "lt" if reverse else "gt"
+            queryset = queryset.filter(
+                models.Q(**{f"history_id__{op}": history_id})
+                | models.Q(history_id=history_id, **{f"created_at__{op}": created_at})
+                | models.Q(history_id=history_id, created_at=created_at, **{f"pk__{op}": pk})
+            )
+        return queryset[:size]
+
+    def changed_field(self, name, since=None, until=None):
+        """
+        return the logs which changed the field `name` in [since, until), json columns deferred
+
+        it reads the changed fields index, kept only for the models registered with `index_changes=True`
+        """
+        # a single filter() call, so every condition applies to the same index row
+        lookups = {"changed_fields__name": name}
+        if since is not None:
+            lookups["changed_fields__created_at__gte"] = since
+        if until is not None:
+            lookups["changed_fields__created_at__lt"] = until
+        return self.filter(**lookups).summaries()
 
 
-class HistoryLogManager(models.Manager.from_queryset(HistoryQuerySet)):
+class HistoryLogManager(models.Manager.from_queryset(HistoryLogQuerySet)):
     pass
 
 
@@ -219,18 +902,26 @@ class HistoryLog(TimestampModel):
     label = models.CharField(
         max_length=255,
     )
-    fields = _fields.JSONField(
+    fields = _fields.CompressedJSONField(
         encoder=DjangoJSONEncoder,
         verbose_name=_("fields"),
     )
-    updated = _fields.JSONField(
+    updated = _fields.CompressedJSONField(
         encoder=DjangoJSONEncoder,
         verbose_name=_("updated fields"),
     )
+    delta = models.BooleanField(
+        default=False,
+        verbose_name=_("delta"),
+        help_text=_("fields stores only the changes from the previous log"),
+    )
 
     objects = HistoryLogManager()
 
     class Meta:
+        indexes = [
+            models.Index(fields=["history", "created_at"], name="historylog_history_created_idx"),
+        ]
         ordering = ["created_at"]
         verbose_name = _("log")
         verbose_name_plural = _("logs")
@@ -240,3 +931,108 @@ class HistoryLog(TimestampModel):
             obj=self.label,
             tm=self.created_at,
         )
+
+    def apply(self, prev_fields):
+        """
+        return the full snapshot of this log, given the full snapshot of the previous one
+        """
+        if not self.delta:
+            return self.fields
+        if prev_fields is None:
+            return None
+        fields = {key: value for key, value in prev_fields.items() if key not in self.updated or key in self.fields}
+        fields.update(self.fields)
+        return fields
+
+    def get_fields(self):
+        """
+        return the full snapshot, replaying the deltas from the nearest keyframe
+        """
+        if not self.delta:
+            return self.fields
+        keyframes = HistoryLog.objects.filter(history_id=self.history_id, delta=False, created_at__lte=self.created_at)
+        logs = HistoryLog.objects.filter(
+            history_id=self.history_id,
+            created_at__gte=models.Subquery(keyframes.order_by("-created_at", "-pk").values("created_at")[:1]),
+            created_at__lte=self.created_at,
+        ).order_by("created_at", "pk")
+        fields = None
+        for log in logs:
+            fields = log.apply(fields)
+            if log.pk == self.pk:
+                break
+        return fields
+
+
+class HistoryChangedFieldManager(models.Manager):
+    def index(self, logs):
+        """
+        insert the index rows of the changed fields of saved logs
+        """
+        return self.bulk_create(
+            [HistoryChangedField(log=log, name=name, created_at=log.created_at) for log in logs for name in log.updated]
+        )
+
+
+class HistoryChangedField(models.Model):
+    log = models.ForeignKey(
+        HistoryLog,
+        # no database constraint, HistoryLog can be a partitioned table (see `model_history.partitioning`)
+        db_constraint=False,
+        db_index=False,
+        on_delete=models.CASCADE,
+        related_name="changed_fields",
+        verbose_name=_("log"),
+    )
+    name = models.CharField(
+        max_length=255,
+        verbose_name=_("field name"),
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("created"),
+        help_text=_("the creation time of the log"),
+    )
+
+    objects = HistoryChangedFieldManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["log", "name"], name="changedfield_log_name_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["name", "created_at"], name="changedfield_name_created_idx"),
+        ]
+        verbose_name = _("changed field")
+        verbose_name_plural = _("changed fields")
+
+    def __str__(self):
+        return f"{self.name} [{self.log_id}]"
+
+
+class HistoryOutbox(models.Model):
+    created_at = _fields.CreationDateTimeField(
+        verbose_name=_("created"),
+    )
+    source_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name=_("source content type"),
+    )
+    source_key = models.CharField(
+        max_length=255,
+        verbose_name=_("source key"),
+    )
+    label = models.CharField(
+        max_length=255,
+    )
+    fields = _fields.JSONField(
+        encoder=DjangoJSONEncoder,
+        verbose_name=_("fields"),
+    )
+
+    class Meta:
+        verbose_name = _("outbox entry")
+        verbose_name_plural = _("outbox entries")
+
+    def __str__(self):
+        return f"{self.label} [{self.source_type_id} {self.source_key}]"
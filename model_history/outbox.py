@@ -0,0 +1,167 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+__all__ = ["DatabaseOutbox", "LocalOutbox", "get_outbox", "process"]
+
+
+class DatabaseOutbox:
+    """
+    Durable outbox: entries are saved in the `HistoryOutbox` table, in the same transaction of the change.
+    """
+
+    def put(self, entry, using=None):
+        entry.save(using=using)
+
+    def get_batch(self, size, using=None):
+        from .models import HistoryOutbox
+
+        return list(HistoryOutbox.objects.using(using).select_related("source_type").order_by("pk")[:size])
+
+    def claim(self, entry, using=None):
+        """
+        lock a queued entry until the end of the transaction, return False if another worker took it
+        """
+        from .models import HistoryOutbox
+
+        entries = HistoryOutbox.objects.using(using).filter(pk=entry.pk)
+        if connections[entries.db].features.has_select_for_update_skip_locked:
+            entries = entries.select_for_update(skip_locked=True)
+        return bool(list(entries.values_list("pk", flat=True)))
+
+    def ack(self, entry, using=None):
+        """
+        delete an applied entry, return False if another worker deleted it first
+        """
+        deleted, _ = entry.delete(using=using)
+        return deleted > 0
+
+
+class LocalOutbox:
+    """
+    In-process outbox, useful for tests and development: entries are lost on exit.
+    """
+
+    def __init__(self):
+        self.queue = deque()
+
+    def put(self, entry, using=None):
+        self.queue.append(entry)
+
+    def get_batch(self, size, using=None):
+        batch = []
+        while self.queue and len(batch) < size:
+            batch.append(self.queue.popleft())
+        return batch
+
+    def claim(self, entry, using=None):
+        return True
+
+    def ack(self, entry, using=None):
+        return True
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                backend = getattr(settings, "MODEL_HISTORY_OUTBOX", "model_history.outbox.DatabaseOutbox")
+                _outbox = import_string(backend)()
+    return _outbox
+
+
+def get_history(entry, using=None):
+    from .models import History
+
+    try:
+        return (
+            History.objects.using(using)
+            .select_related("head")
+            .get(source_type=entry.source_type, source_key=entry.source_key)
+        )
+    except History.DoesNotExist:
+        pk = entry.source_type.model_class()._meta.pk.to_python(entry.source_key)
+        return History.for_source(entry.source_type, pk)
+
+
+def apply(entries, outbox, using=None):
+    """
+    log the entries of a single source object, in order
+
+    every entry is claimed and acked in the same transaction of its log, so an entry is never logged twice,
+    by a retry or by another worker; the entries left after one taken by another worker are left to it,
+    to keep their order
+    """
+    history = None
+    for entry in entries:
+        with transaction.atomic(using=using):
+            if not outbox.claim(entry, using=using):
+                return
+            if history is None:
+                # loaded after the claim, with the logs of the entries applied before it
+                history = get_history(entry, using=using)
+            history.add_log(entry.fields, entry.label, using=using)
+            if not outbox.ack(entry, using=using):
+                # applied by another worker in the meantime
+                transaction.set_rollback(True, using=using)
+                return
+
+
+def process(outbox=None, batch_size=100, threads=1, using=None):
+    """
+    drain a batch of entries from the outbox, return the number of processed entries
+
+    entries of the same source object are applied in order by the same thread
+    """
+    outbox = get_outbox() if outbox is None else outbox
+    batch = outbox.get_batch(batch_size, using=using)
+    groups = {}
+    for entry in batch:
+        groups.setdefault((entry.source_type_id, entry.source_key), []).append(entry)
+
+    if threads <= 1:
+        for entries in groups.values():
+            apply(entries, outbox, using=using)
+    else:
+
+        def worker(entries):
+            try:
+                apply(entries, outbox, using=using)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            # consume the results to propagate the exceptions
+            list(executor.map(worker, groups.values()))
+    return len(batch)
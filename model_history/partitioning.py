@@ -0,0 +1,253 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import datetime
+
+from django.db import connections, transaction
+from django.db.migrations.operations.base import Operation
+from django.utils import timezone
+
+from .cache import get_timeline_cache
+
+__all__ = [
+    "INTERVALS",
+    "PartitionHistoryLog",
+    "create_partitions",
+    "drop_partitions",
+    "get_partitions",
+    "is_partitioned",
+]
+
+TABLE = "model_history_historylog"
+INTERVALS = ["month", "year"]
+
+
+def is_supported(connection):
+    return connection.vendor == "postgresql"
+
+
+def is_partitioned(connection):
+    """
+    return True if the HistoryLog table is range partitioned (PostgreSQL only)
+    """
+    if not is_supported(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_bounds(start, interval):
+    """
+    return the (start, end) range of the partition holding `start`
+    """
+    if interval == "year":
+        start = datetime.datetime(start.year, 1, 1, tzinfo=datetime.timezone.utc)
+        return start, start.replace(year=start.year + 1)
+    start = datetime.datetime(start.year, start.month, 1, tzinfo=datetime.timezone.utc)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def get_partition_name(start, interval):
+    return f"{TABLE}_p{start:%Y}" if interval == "year" else f"{TABLE}_p{start:%Y%m}"
+
+
+def parse_partition_name(name):
+    """
+    return the (start, end, interval) of a partition from its name, None for the default partition
+    """
+    suffix = name.rpartition("_p")[2]
+    if not suffix.isdigit():
+        return None
+    if len(suffix) == 4:
+        interval, start = "year", datetime.datetime(int(suffix), 1, 1, tzinfo=datetime.timezone.utc)
+    else:
+        interval = "month"
+        start = datetime.datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=datetime.timezone.utc)
+    return (*get_bounds(start, interval), interval)
+
+
+def get_partitions(connection):
+    """
+    return the sorted (name, start, end, interval) of the range partitions
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_table_is_visible(p.oid)",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = [(name, *bounds) for name in names if (bounds := parse_partition_name(name)) is not None]
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partitions(connection, start, end, interval="month"):
+    """
+    create the missing partitions covering [start, end), return their names
+    """
+    existing = {name for name, *bounds in get_partitions(connection)}
+    created = []
+    quote = connection.ops.quote_name
+    lower, upper = get_bounds(start, interval)
+    with connection.cursor() as cursor:
+        while lower < end:
+            name = get_partition_name(lower, interval)
+            if name not in existing:
+                cursor.execute(
+                    f"CREATE TABLE {quote(name)} PARTITION OF {quote(TABLE)} FOR VALUES FROM (%s) TO (%s)",
+                    [lower, upper],
+                )
+                created.append(name)
+            lower, upper = get_bounds(upper, interval)
+    return created
+
+
+def drop_partitions(before, using="default"):
+    """
+    drop the partitions ending before `before`, return their names
+
+    before dropping a partition the logs which outlive it are made rebuildable:
+    the first later log of every history becomes a full snapshot if it is a delta,
+    and the histories whose last log is dropped keep its fields in `History.snapshot`,
+    the changed fields index rows of the dropped logs are deleted, and the cached timelines invalidated
+    """
+    from .models import History, HistoryChangedField, HistoryLog
+
+    connection = connections[using]
+    dropped = []
+    for name, start, end, interval in get_partitions(connection):
+        if end > before:
+            break
+        with transaction.atomic(using=using):
+            logs = HistoryLog.objects.using(using).filter(created_at__gte=start, created_at__lt=end)
+            for history in History.objects.using(using).filter(head__in=logs.values("pk")).select_related("head"):
+                history.snapshot, history.head, history.deltas = history.get_current_fields(), None, 0
+                history.save_base(using=using, update_fields=["snapshot", "head", "deltas"])
+            history_ids = logs.order_by().values("history_id").distinct()
+            for history_id in history_ids.values_list("history_id", flat=True).iterator():
+                log = (
+                    HistoryLog.objects.using(using)
+                    .filter(history_id=history_id, created_at__gte=end)
+                    .order_by("created_at", "pk")
+                    .first()
+                )
+                if log is not None and log.delta:
+                    log.fields, log.delta = log.get_fields(), False
+                    log.save(update_fields=["fields", "delta"])
+            HistoryChangedField.objects.using(using).filter(log__in=logs.values("pk"))._raw_delete(using)
+            if (timeline_cache := get_timeline_cache()) is not None:
+                timeline_cache.invalidate(
+                    History.objects.using(using).filter(pk__in=history_ids).values_list("pk", "head_id")
+                )
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+        dropped.append(name)
+    return dropped
+
+
+class PartitionHistoryLog(Operation):
+    """
+    Convert the HistoryLog table to a table range partitioned by `created_at` on PostgreSQL.
+
+    Add it to a migration of your project, depending on the last model_history migration:
+
+        operations = [
+            PartitionHistoryLog(interval="month"),
+        ]
+
+    Existing logs are copied into the partitions covering them.
+    The primary key becomes (id, created_at), as PostgreSQL requires, and the foreign keys
+    pointing to HistoryLog are dropped, as they cannot reference a partitioned table.
+    On other databases the operation does nothing, and the model API is the same everywhere.
+    """
+
+    reversible = False
+    reduces_to_sql = False
+
+    def __init__(self, interval="month", ahead=3):
+        if interval not in INTERVALS:
+            raise ValueError(f"interval must be one of {', '.join(INTERVALS)}.")
+        self.interval = interval
+        self.ahead = ahead
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {"interval": self.interval, "ahead": self.ahead}
+
+    def describe(self):
+        return f"Partition HistoryLog by {self.interval}"
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        if not is_supported(connection) or is_partitioned(connection):
+            return
+        quote = connection.ops.quote_name
+        old, sequence = f"{TABLE}_unpartitioned", f"{TABLE}_partitioned_id_seq"
+
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                constraints = connection.introspection.get_constraints(cursor, table)
+                for constraint, info in constraints.items():
+                    if info["foreign_key"] and info["foreign_key"][0] == TABLE and table != TABLE:
+                        schema_editor.execute(f"ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(constraint)}")
+            cursor.execute(f"SELECT MIN(created_at), MAX(id) FROM {quote(TABLE)}")
+            first, last_id = cursor.fetchone()
+
+        schema_editor.execute(f"ALTER TABLE {quote(TABLE)} RENAME TO {quote(old)}")
+        schema_editor.execute(
+            f"CREATE TABLE {quote(TABLE)} (LIKE {quote(old)} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+        )
+        schema_editor.execute(f"CREATE SEQUENCE {quote(sequence)} START WITH {(last_id or 0) + 1}")
+        schema_editor.execute(
+            f"ALTER TABLE {quote(TABLE)} ALTER COLUMN id DROP IDENTITY IF EXISTS, "
+            f"ALTER COLUMN id SET DEFAULT nextval('{sequence}')"
+        )
+        schema_editor.execute(f"CREATE TABLE {quote(f'{TABLE}_default')} PARTITION OF {quote(TABLE)} DEFAULT")
+
+        now = timezone.now()
+        upper = now
+        for n in range(self.ahead):
+            upper = get_bounds(upper, self.interval)[1]
+        create_partitions(connection, first or now, upper, self.interval)
+
+        schema_editor.execute(f"INSERT INTO {quote(TABLE)} SELECT * FROM {quote(old)}")
+        schema_editor.execute(f"DROP TABLE {quote(old)}")
+        schema_editor.execute(f"ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(TABLE)}.id")
+        schema_editor.execute(f"ALTER TABLE {quote(TABLE)} ADD PRIMARY KEY (id, created_at)")
+        schema_editor.execute(f"CREATE INDEX {quote(f'{TABLE}_history_id')} ON {quote(TABLE)} (history_id)")
+        schema_editor.execute(
+            f"CREATE INDEX {quote('historylog_history_created_idx')} ON {quote(TABLE)} (history_id, created_at)"
+        )
+        schema_editor.execute(
+            f"ALTER TABLE {quote(TABLE)} ADD FOREIGN KEY (history_id) "
+            f"REFERENCES {quote('model_history_history')} (id) DEFERRABLE INITIALLY DEFERRED"
+        )
@@ -0,0 +1,176 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import datetime
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.db.models.functions import Cast, Length
+from django.utils import timezone
+
+from .cache import get_timeline_cache
+
+__all__ = ["RetentionPolicy", "get_policies"]
+
+
+class RetentionPolicy:
+    """
+    Drop the logs of a model beyond the last `keep_last` versions, or older than `max_age`.
+
+    The last log of every history is always kept.
+    With `squash=True` the newest dropped log of every history is kept as a full snapshot
+    of the dropped versions, otherwise the oldest kept log is turned into a full snapshot if it is a delta.
+    """
+
+    def __init__(self, model, keep_last=None, max_age=None, squash=False):
+        if keep_last is None and max_age is None:
+            raise ValueError("At least one of keep_last and max_age is required.")
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be a positive number.")
+        if isinstance(max_age, (int, float)):
+            max_age = datetime.timedelta(days=max_age)
+        self.model = model
+        self.keep_last = keep_last
+        self.max_age = max_age
+        self.squash = squash
+
+    def __repr__(self):
+        return (
+            f"<RetentionPolicy {self.model._meta.label_lower} "
+            f"keep_last={self.keep_last} max_age={self.max_age} squash={self.squash}>"
+        )
+
+    def get_dropped(self, history_ids, head_ids, now, last_log_id, using=None):
+        from .models import HistoryLog
+
+        logs = HistoryLog.objects.using(using).filter(history_id__in=history_ids).exclude(pk__in=head_ids)
+        rules = models.Q()
+        if self.keep_last is not None:
+            # logs written after `last_log_id` do not move the cutoff of the logs prepared for the drop
+            newer = HistoryLog.objects.using(using).filter(history=models.OuterRef("history"), pk__lte=last_log_id)
+            offset = self.keep_last - 1
+            logs = logs.alias(
+                cutoff=models.Subquery(newer.order_by("-created_at", "-pk").values("created_at")[offset:][:1])
+            )
+            rules |= models.Q(created_at__lt=models.F("cutoff"))
+        if self.max_age is not None:
+            rules |= models.Q(created_at__lt=now - self.max_age)
+        return logs.filter(rules)
+
+    def prepare(self, dropped, history_id):
+        """
+        make the logs which survive the drop rebuildable, return the pk of the log to keep, if any
+        """
+        from .models import HistoryChangedField, HistoryLog
+
+        dropped = dropped.filter(history_id=history_id)
+        if self.squash:
+            log = dropped.order_by("-created_at", "-pk").first()
+            if log is None:
+                return None
+            log.fields, log.updated, log.delta = log.get_fields(), {}, False
+            log.save(update_fields=["fields", "updated", "delta"])
+            HistoryChangedField.objects.using(dropped.db).filter(log=log)._raw_delete(dropped.db)
+            return log.pk
+
+        first = dropped.order_by("-created_at", "-pk").values("created_at")[:1]
+        log = (
+            HistoryLog.objects.using(dropped.db)
+            .filter(history_id=history_id, created_at__gte=models.Subquery(first))
+            .exclude(pk__in=dropped.values("pk"))
+            .order_by("created_at", "pk")
+            .first()
+        )
+        if log is not None and log.delta:
+            log.fields, log.delta = log.get_fields(), False
+            log.save(update_fields=["fields", "delta"])
+        return None
+
+    def apply(self, batch_size=500, chunk_size=10000, sleep=0, start_after=None, using=None):
+        """
+        apply the policy, a batch of histories at a time; yield (last history pk, deleted rows, reclaimed bytes)
+
+        the logs which survive the drop are made rebuildable first, then the dropped logs (and their changed
+        fields index rows) are deleted with raw deletes, in primary key ranges of `chunk_size`,
+        each in its own transaction; pass the last yielded history pk as `start_after` to resume an interrupted run
+        """
+        from .models import History, HistoryChangedField, HistoryLog
+
+        source_type = ContentType.objects.db_manager(using).get_for_model(self.model)
+        histories = (
+            History.objects.using(using).filter(source_type=source_type).order_by("pk").values_list("pk", "head_id")
+        )
+        now, last = timezone.now(), start_after
+        last_log_id = HistoryLog.objects.using(using).aggregate(pk=models.Max("pk"))["pk"] or 0
+
+        while batch := list((histories if last is None else histories.filter(pk__gt=last))[:batch_size]):
+            history_ids = [history_id for history_id, head_id in batch]
+            head_ids = [head_id for history_id, head_id in batch if head_id is not None]
+            dropped = self.get_dropped(history_ids, head_ids, now, last_log_id, using=using)
+            with transaction.atomic(using=using):
+                touched = list(dropped.order_by().values_list("history_id", flat=True).distinct())
+                kept = [pk for pk in (self.prepare(dropped, history_id) for history_id in touched) if pk]
+            dropped = dropped.exclude(pk__in=kept)
+            deleted = reclaimed = 0
+            bounds = dropped.aggregate(first=models.Min("pk"), last=models.Max("pk"))
+            if bounds["first"] is not None:
+                # newest first, the dropped logs left by an interrupted run are still rebuildable
+                for end in range(bounds["last"], bounds["first"] - 1, -chunk_size):
+                    with transaction.atomic(using=using):
+                        chunk = dropped.filter(pk__gt=end - chunk_size, pk__lte=end)
+                        reclaimed += (
+                            chunk.aggregate(
+                                size=models.Sum(
+                                    Length(Cast("fields", models.TextField()))
+                                    + Length(Cast("updated", models.TextField()))
+                                )
+                            )["size"]
+                            or 0
+                        )
+                        HistoryChangedField.objects.using(chunk.db).filter(log__in=chunk.values("pk"))._raw_delete(
+                            chunk.db
+                        )
+                        deleted += chunk._raw_delete(chunk.db)
+            if touched and (timeline_cache := get_timeline_cache()) is not None:
+                heads = dict(batch)
+                timeline_cache.invalidate([(history_id, heads[history_id]) for history_id in touched])
+            last = history_ids[-1]
+            yield last, deleted, reclaimed
+            if sleep:
+                time.sleep(sleep)
+
+
+def get_policies():
+    """
+    return the policies configured in the MODEL_HISTORY_RETENTION setting, like
+
+        MODEL_HISTORY_RETENTION = {
+            "auth.user": {"keep_last": 100, "max_age": 365, "squash": True},
+        }
+
+    where `max_age` is a timedelta or a number of days
+    """
+    config = getattr(settings, "MODEL_HISTORY_RETENTION", {})
+    return [RetentionPolicy(apps.get_model(label), **options) for label, options in config.items()]
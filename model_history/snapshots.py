@@ -0,0 +1,247 @@
+# Copyright (C) 2017-2022, Raffaele Salmaso <raffaele@salmaso.org>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.  IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from __future__ import annotations
+
+import base64
+import copy
+import datetime
+import functools
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.utils import timezone
+from django.utils.duration import duration_string
+
+__all__ = ["ENGINES", "Snapshot", "build_drf_serializer_class", "build_native_serializer_class", "get_default_engine"]
+
+ENGINES = ["drf", "native"]
+
+
+@functools.lru_cache(maxsize=None)
+def get_default_engine():
+    """
+    return "drf" if django rest framework is installed, else "native"
+
+    resolved once, a missing package is not looked up again on every serializer lookup
+    """
+    try:
+        import rest_framework  # noqa: F401
+    except ImportError:
+        return "native"
+    return "drf"
+
+
+def order_by_pk(queryset):
+    """
+    return the objects of a many to many relation without a model ordering in primary key order,
+    as the database does not guarantee any order otherwise
+    """
+    if queryset.model._meta.ordering:
+        return queryset
+    if queryset._result_cache is not None:
+        # prefetched
+        return sorted(queryset, key=lambda obj: obj.pk)
+    return queryset.order_by("pk")
+
+
+def build_drf_serializer_class(model_class, fields_opt, exclude_opt):
+    try:
+        from rest_framework import relations, serializers
+    except ImportError as e:
+        raise ImproperlyConfigured("The drf snapshot engine requires djangorestframework.") from e
+
+    class ManyRelatedField(relations.ManyRelatedField):
+        def get_attribute(self, instance):
+            values = super().get_attribute(instance)
+            return order_by_pk(values) if isinstance(values, models.QuerySet) else values
+
+    class PrimaryKeyRelatedField(relations.PrimaryKeyRelatedField):
+        @classmethod
+        def many_init(cls, *args, **kwargs):
+            list_kwargs = {"child_relation": cls(*args, **kwargs)}
+            list_kwargs.update((key, value) for key, value in kwargs.items() if key in relations.MANY_RELATION_KWARGS)
+            return ManyRelatedField(**list_kwargs)
+
+    class ModelSerializer(serializers.ModelSerializer):
+        serializer_related_field = PrimaryKeyRelatedField
+        _cached_fields = None
+
+        class Meta:
+            fields = fields_opt
+            exclude = exclude_opt
+            model = model_class
+
+        def get_fields(self):
+            # model introspection is done only once per class,
+            # every instance get its own copy of the (to be bound) fields
+            klass = type(self)
+            if klass._cached_fields is None:
+                klass._cached_fields = super().get_fields()
+            return copy.deepcopy(klass._cached_fields)
+
+    return ModelSerializer
+
+
+def to_datetime(value):
+    if value is None:
+        return None
+    if settings.USE_TZ and timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = f"{value[:-6]}Z"
+    return value
+
+
+def to_isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def to_str(value):
+    return None if value is None else str(value)
+
+
+def to_duration(value):
+    return None if value is None else duration_string(value)
+
+
+def to_file(value):
+    # raw value can be a string or a file
+    return getattr(value, "name", value) or None
+
+
+def to_binary(value):
+    return None if value is None else base64.b64encode(bytes(value)).decode("ascii")
+
+
+def to_json(value):
+    if value is None or isinstance(value, (str, int, float, bool, list, dict)):
+        return value
+    if isinstance(value, datetime.datetime):
+        return to_datetime(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return duration_string(value)
+    # decimals, uuids and the like
+    return str(value)
+
+
+def get_converter(field):
+    """
+    return the function converting the raw `field.attname` value to a json safe value
+    """
+    if field.is_relation:
+        return get_converter(field.target_field)
+    if isinstance(field, models.DateTimeField):
+        return to_datetime
+    if isinstance(field, (models.DateField, models.TimeField)):
+        return to_isoformat
+    if isinstance(field, (models.DecimalField, models.UUIDField)):
+        return to_str
+    if isinstance(field, models.DurationField):
+        return to_duration
+    if isinstance(field, models.FileField):
+        return to_file
+    if isinstance(field, models.BinaryField):
+        return to_binary
+    if isinstance(
+        field,
+        (
+            models.JSONField,
+            models.BooleanField,
+            models.IntegerField,
+            models.FloatField,
+            models.CharField,
+            models.TextField,
+        ),
+    ):
+        # already json safe
+        return None
+    return to_json
+
+
+def get_many_to_many_extractor(field):
+    name = field.name
+    convert = get_converter(field.target_field)
+
+    def extract(instance):
+        cache = getattr(instance, "_prefetched_objects_cache", {})
+        if name in cache:
+            values = [obj.pk for obj in order_by_pk(cache[name])]
+        else:
+            values = order_by_pk(getattr(instance, name).values_list("pk", flat=True))
+        return [convert(value) for value in values] if convert else list(values)
+
+    return extract
+
+
+class Snapshot:
+    """
+    Serializer-like class reading the raw field values of an instance.
+
+    Subclasses are built once for each model by `build_native_serializer_class()`.
+    """
+
+    model = None
+    fields = ()
+    relations = ()
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    @property
+    def data(self):
+        instance = self.instance
+        values = instance.__dict__
+        data = {}
+        for name, attname, convert in self.fields:
+            if attname not in values:
+                # deferred field
+                instance.refresh_from_db(fields=[attname])
+            value = values[attname]
+            data[name] = value if convert is None else convert(value)
+        for name, extract in self.relations:
+            data[name] = extract(instance)
+        return data
+
+
+def build_native_serializer_class(model_class, fields_opt, exclude_opt):
+    def included(field):
+        if fields_opt and fields_opt != "__all__" and field.name not in fields_opt:
+            return False
+        return field.name not in (exclude_opt or ())
+
+    attrs = {
+        "model": model_class,
+        "fields": tuple(
+            (field.name, field.attname, get_converter(field))
+            for field in model_class._meta.concrete_fields
+            if included(field)
+        ),
+        "relations": tuple(
+            (field.name, get_many_to_many_extractor(field))
+            for field in model_class._meta.many_to_many
+            if included(field)
+        ),
+    }
+    return type(f"{model_class.__name__}Snapshot", (Snapshot,), attrs)
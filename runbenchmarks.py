@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test.utils import get_runner
+
+
+def runbenchmarks():
+    from benchmarks import BENCHMARKS
+
+    parser = argparse.ArgumentParser(description="Run the benchmarks and print the results as JSON.")
+    parser.add_argument("benchmarks", nargs="*", default=BENCHMARKS, help="Benchmarks to run.")
+    parser.add_argument("--output", help="Write the results to this file.")
+    parser.add_argument(
+        "--settings", help="Django settings module, e.g. one using PostgreSQL (default: tests.settings)."
+    )
+    args = parser.parse_args()
+
+    if args.settings:
+        os.environ["DJANGO_SETTINGS_MODULE"] = args.settings
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    settings.INSTALLED_APPS = [*settings.INSTALLED_APPS, "benchmarks"]
+    django.setup()
+
+    import model_history
+
+    TestRunner = get_runner(settings)
+    test_runner = TestRunner(verbosity=0)
+    old_config = test_runner.setup_databases()
+    try:
+        results = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "model_history": model_history.__version__,
+                "database": connection.vendor,
+            },
+        }
+        for name in args.benchmarks:
+            results[name] = importlib.import_module(f"benchmarks.{name}").run()
+    finally:
+        test_runner.teardown_databases(old_config)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output)
+    else:
+        sys.stdout.write(f"{output}\n")
+
+
+if __name__ == "__main__":
+    runbenchmarks()
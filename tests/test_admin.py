@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from model_history.admin import HistoryAdmin
+from model_history.models import History, HistoryLog
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="admin")
+        self.client.force_login(self.admin)
+        History.register(User, exclude=["password", "last_login"])
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def create_user(self, changes):
+        user = User.objects.create_user(username="user")
+        for n in range(changes):
+            user.first_name = f"name {n}"
+            user.save()
+        return user, History.objects.get(source_id=user.pk)
+
+    def test_changelist(self):
+        user, history = self.create_user(3)
+        url = reverse("admin:model_history_history_changelist")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "auth.user")
+        # the source type filter does not scan the histories
+        self.assertFalse(any("DISTINCT" in query["sql"] for query in ctx.captured_queries))
+
+        source_type = ContentType.objects.get_for_model(User)
+        response = self.client.get(url, {"source_type": source_type.pk})
+        self.assertEqual(list(response.context["cl"].result_list), [history])
+        response = self.client.get(url, {"source_type": ContentType.objects.get_for_model(ContentType).pk})
+        self.assertEqual(list(response.context["cl"].result_list), [])
+
+        response = self.client.get(url, {"q": f"auth.user:{user.pk}"})
+        self.assertEqual(list(response.context["cl"].result_list), [history])
+        response = self.client.get(url, {"q": "auth.group"})
+        self.assertEqual(list(response.context["cl"].result_list), [])
+        response = self.client.get(url, {"q": str(user.pk)})
+        self.assertEqual(list(response.context["cl"].result_list), [history])
+        response = self.client.get(url, {"q": "user"})
+        self.assertEqual(list(response.context["cl"].result_list), [])
+
+    def test_change_view_is_bounded(self):
+        def count(changes):
+            user, history = self.create_user(changes)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("admin:model_history_history_change", args=[history.pk]))
+            self.assertEqual(response.status_code, 200)
+            user.delete()
+            History.objects.all().delete()
+            return len(ctx), response
+
+        count(1)  # warm up the content types cache
+        few, _ = count(2)
+        many, response = count(30)
+        self.assertEqual(few, many)
+        self.assertContains(response, "<strong>first_name</strong>", count=HistoryAdmin.logs_per_page)
+        self.assertContains(response, "?history__id__exact=")
+
+    def test_logs(self):
+        user, history = self.create_user(3)
+        response = self.client.get(
+            reverse("admin:model_history_historylog_changelist"), {"history__id__exact": history.pk}
+        )
+        self.assertEqual(response.status_code, 200)
+        logs = list(response.context["cl"].result_list)
+        self.assertEqual(len(logs), 4)
+        self.assertEqual(logs[0].get_deferred_fields(), {"fields"})
+        self.assertContains(response, "first_name")
+
+        log = HistoryLog.objects.filter(history=history).latest("created_at")
+        response = self.client.get(reverse("admin:model_history_historylog_change", args=[log.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "&quot;name 1&quot; &rarr; &quot;name 2&quot;")
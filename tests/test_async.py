@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from model_history.cache import TimelineCache, get_timeline_cache
+from model_history.models import History, HistoryLog
+
+
+class AsyncTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="user")
+        self.group = Group.objects.create(name="group")
+
+    async def test_alog(self):
+        history = await History.objects.afetch(self.user)
+        self.assertIsNone(history.pk)
+        self.assertIs(history.source, self.user)
+
+        history = await History.objects.alog(self.user, exclude=["password"])
+        self.user.first_name = "first"
+        await History.objects.alog(self.user, exclude=["password"])
+        history = await History.objects.afetch(self.user)
+        self.assertEqual(await sync_to_async(history.logs.count)(), 2)
+        self.assertEqual(history.head.updated, {"first_name": ""})
+        self.assertNotIn("password", history.head.fields)
+
+    async def test_alog_many(self):
+        logs = await History.objects.alog_many([self.user, self.group])
+        self.assertEqual(len(logs), 2)
+        self.assertEqual(await sync_to_async(HistoryLog.objects.count)(), 2)
+        self.assertEqual((await History.objects.afetch(self.group)).head.fields["name"], "group")
+
+    async def test_aget_timeline(self):
+        await History.objects.alog(self.user, exclude=["password"])
+        history = await History.objects.afetch(self.user)
+        logs, fields = await history.aget_timeline()
+        self.assertEqual([log.pk for log in logs], [history.head_id])
+        self.assertEqual(fields["username"], "user")
+
+    @override_settings(MODEL_HISTORY_TIMELINE_CACHE=True)
+    async def test_aget_timeline_cached(self):
+        await sync_to_async(cache.clear)()
+        await History.objects.alog(self.user, exclude=["password"])
+        history = await History.objects.afetch(self.user)
+        first = await history.aget_timeline()
+        self.assertEqual(await history.aget_timeline(), first)
+        self.assertEqual(history.get_timeline(), first)
+        self.assertEqual(get_timeline_cache().stats(), {"hits": 2, "misses": 1})
+        self.assertEqual(await History().aget_timeline(), ([], None))
+
+    @override_settings(MODEL_HISTORY_TIMELINE_CACHE=True)
+    async def test_aget_timeline_sync_cache(self):
+        # caches without async methods, before Django 4.0
+        await sync_to_async(cache.clear)()
+        sync_cache = mock.Mock(spec=["get", "set"], wraps=cache)
+        await History.objects.alog(self.user, exclude=["password"])
+        history = await History.objects.afetch(self.user)
+        with mock.patch.object(TimelineCache, "cache", new_callable=mock.PropertyMock, return_value=sync_cache):
+            first = await history.aget_timeline()
+            self.assertEqual(await history.aget_timeline(), first)
+        self.assertEqual((sync_cache.get.call_count, sync_cache.set.call_count), (2, 1))
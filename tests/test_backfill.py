@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import io
+
+from django.contrib.auth.models import Group, User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from model_history.backfill import backfill
+from model_history.models import History, HistoryLog
+
+
+class BackfillTestCase(TestCase):
+    def setUp(self):
+        group = Group.objects.create(name="group")
+        self.users = User.objects.bulk_create([User(username=f"user{n}") for n in range(7)])
+        self.users[0].groups.add(group)
+        History.register(User, exclude=["password"])
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_backfill(self):
+        History.objects.log(self.users[2], exclude=["password"])
+
+        chunks = list(backfill(User, chunk_size=3))
+        self.assertEqual(chunks, [(self.users[2].pk, 2), (self.users[5].pk, 3), (self.users[6].pk, 1)])
+        self.assertEqual(History.objects.count(), 7)
+        self.assertEqual(HistoryLog.objects.count(), 7)
+        log = HistoryLog.objects.for_object(self.users[0]).defer(None).get()
+        self.assertEqual(log.updated, {})
+        self.assertEqual(log.fields["groups"], [self.users[0].groups.get().pk])
+        self.assertNotIn("password", log.fields)
+
+        # the first change is diffed against the baseline
+        self.users[1].first_name = "first"
+        self.users[1].save()
+        self.assertEqual(History.objects.fetch(self.users[1]).head.updated, {"first_name": ""})
+
+        # already logged rows are skipped
+        self.assertEqual(list(backfill(User, chunk_size=10)), [(self.users[6].pk, 0)])
+
+    def test_resume(self):
+        self.assertEqual([count for last, count in backfill(User, chunk_size=3, start_after=self.users[3].pk)], [3])
+        self.assertEqual(History.objects.count(), 3)
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command("history_backfill", "auth.user", "--chunk-size", "2", stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "auth.user: 7 rows logged.\n")
+
+        with self.assertRaises(CommandError):
+            call_command("history_backfill", "auth.group")
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.test import TestCase
+
+from model_history.models import History, HistoryLog
+
+
+class BatchLogTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"], batch=True)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_flush_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user = User.objects.create_user(username="test")
+            for n in range(5):
+                user.first_name = f"name {n}"
+                user.save()
+            self.assertEqual(History.objects.count(), 0)
+        self.assertEqual(len(callbacks), 1)
+        history = History.objects.fetch(user)
+        self.assertEqual(history.logs.count(), 1)
+        log = history.logs.get()
+        self.assertEqual(log.fields["first_name"], "name 4")
+        self.assertEqual(log.updated, {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.first_name = "changed"
+            user.save()
+            other = User.objects.create_user(username="other")
+        self.assertEqual(history.logs.count(), 2)
+        self.assertEqual(history.logs.last().updated, {"first_name": "name 4"})
+        self.assertEqual(History.objects.fetch(other).logs.count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(history.logs.count(), 2)
+
+    def test_unsaved_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="test")
+        with self.captureOnCommitCallbacks(execute=True):
+            user.first_name = "saved"
+            user.save()
+            user.first_name = "never saved"
+        self.assertEqual(History.objects.fetch(user).head.fields["first_name"], "saved")
+
+    def test_savepoint_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="test")
+        with self.captureOnCommitCallbacks(execute=True):
+            user.last_name = "saved"
+            user.save()
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    user.first_name = "rolled back"
+                    user.save()
+                    1 / 0
+        history = History.objects.fetch(user)
+        self.assertEqual(history.head.fields["first_name"], "")
+        self.assertEqual(history.head.fields["last_name"], "saved")
+
+    def test_delete_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="test")
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    user.delete()
+                    1 / 0
+        self.assertTrue(User.objects.filter(username="test").exists())
+        self.assertEqual(HistoryLog.objects.get().fields["username"], "test")
+
+    def test_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="test")
+            user_id = user.pk
+            user.delete()
+        log = HistoryLog.objects.get()
+        self.assertEqual(log.fields["id"], user_id)
+        self.assertEqual(log.history.source_id, user_id)
+
+
+class RelationsLogTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password", "user_permissions"])
+        self.groups = [Group.objects.create(name=f"group{n}") for n in range(3)]
+        self.user = User.objects.create_user(username="test")
+        self.history = History.objects.fetch(self.user)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_coalesce(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.set(self.groups[:2])
+            self.user.groups.set(self.groups[1:])
+            self.user.groups.remove(self.groups[2])
+        self.assertEqual(self.history.logs.count(), 2)
+        self.history.refresh_from_db()
+        self.assertEqual(self.history.head.fields["groups"], [self.groups[1].pk])
+        self.assertEqual(self.history.head.updated, {"groups": []})
+
+    def test_no_serialization(self):
+        with mock.patch.object(History._registry[User], "serialize") as serialize:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.groups.add(*self.groups)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.groups.clear()
+        serialize.assert_not_called()
+        self.history.refresh_from_db()
+        self.assertEqual(self.history.head.fields["groups"], [])
+        self.assertEqual(self.history.logs.count(), 3)
+
+    def test_reverse(self):
+        other = User.objects.create_user(username="other")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groups[0].user_set.add(self.user, other)
+        self.assertEqual(History.objects.fetch(other).head.fields["groups"], [self.groups[0].pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groups[0].user_set.clear()
+        self.assertEqual(History.objects.fetch(other).head.fields["groups"], [])
+        self.assertEqual(History.objects.fetch(self.user).logs.count(), 3)
+
+    def test_pk_order(self):
+        # 10 sorts before 9 as a string
+        groups = [Group.objects.create(pk=10, name="group10"), Group.objects.create(pk=9, name="group9")]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(*groups)
+        self.history.refresh_from_db()
+        self.assertEqual(self.history.head.fields["groups"], [9, 10])
+        self.user.save()
+        self.assertEqual(self.history.logs.count(), 2)
+
+    def test_related_ordering(self):
+        History.unregister(User)
+        History.register(User, exclude=["password"])
+        user = User.objects.create_user(username="permissions")
+        # pk order differs from the (app_label, model, codename) ordering of Permission
+        permissions = list(Permission.objects.filter(codename__in=["add_group", "add_permission"]))
+        self.assertGreater(permissions[0].pk, permissions[1].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.user_permissions.add(*permissions)
+        history = History.objects.fetch(user)
+        self.assertEqual(
+            history.head.fields["user_permissions"], list(user.user_permissions.values_list("pk", flat=True))
+        )
+        user.save()
+        self.assertEqual(history.logs.count(), 2)
+
+    def test_excluded(self):
+        permission = Permission.objects.first()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.user_permissions.add(permission)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.history.logs.count(), 1)
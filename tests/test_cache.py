@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from model_history import metrics
+from model_history.cache import get_timeline_cache
+from model_history.models import History
+from model_history.retention import RetentionPolicy
+
+
+@override_settings(MODEL_HISTORY_TIMELINE_CACHE={"size": 2})
+class TimelineCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        History.register(User, exclude=["password", "last_login"])
+        self.user = User.objects.create(username="user")
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def change(self, **values):
+        for name, value in values.items():
+            setattr(self.user, name, value)
+        self.user.save()
+        return History.objects.fetch(self.user)
+
+    def test_read_through(self):
+        timeline_cache = get_timeline_cache()
+        before = timeline_cache.stats()
+        history = self.change(first_name="first")
+        with metrics.MemoryCollector() as collector:
+            with self.assertNumQueries(1):
+                logs, fields = history.get_timeline()
+            with self.assertNumQueries(0):
+                self.assertEqual(history.get_timeline(), (logs, fields))
+        stats = timeline_cache.stats()
+        self.assertEqual((stats["hits"] - before["hits"], stats["misses"] - before["misses"]), (1, 1))
+        stats = collector.aggregates()["auth.user"]
+        self.assertEqual((stats["hit"]["count"], stats["miss"]["count"]), (1, 1))
+
+        self.assertEqual(
+            [log.pk for log in logs], list(history.logs.order_by("-created_at").values_list("pk", flat=True))
+        )
+        self.assertEqual(logs[0].get_deferred_fields(), {"fields", "updated"})
+        self.assertEqual(fields["first_name"], "first")
+
+    def test_append(self):
+        history = self.change(first_name="first")
+        history.get_timeline()
+        with self.captureOnCommitCallbacks(execute=True):
+            history = self.change(first_name="second")
+        with self.assertNumQueries(0):
+            # updated in place by the new log at commit, under the key of the new head
+            logs, fields = history.get_timeline()
+        self.assertEqual(len(logs), 2)
+        self.assertEqual(logs[0].pk, history.head_id)
+        self.assertEqual(logs[0].label, "user")
+        self.assertEqual(fields["first_name"], "second")
+        self.assertEqual(get_timeline_cache().stats(), {"hits": 1, "misses": 1})
+
+        # a stale history reads its own version
+        History.objects.log_many([self.user])
+        self.user.last_name = "last"
+        History.objects.log_many([self.user])
+        history = History.objects.fetch(self.user)
+        logs, fields = history.get_timeline()
+        self.assertEqual([log.pk for log in logs], [history.head_id, history.head_id - 1])
+        self.assertEqual(fields["last_name"], "last")
+
+    def test_many_in_transaction(self):
+        history = self.change(first_name="first")
+        history.get_timeline()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.change(first_name="second")
+            history = self.change(first_name="third")
+        with self.assertNumQueries(0):
+            logs, fields = history.get_timeline()
+        self.assertEqual(logs[0].pk, history.head_id)
+        self.assertEqual(len(logs), 2)
+        self.assertEqual(fields["first_name"], "third")
+
+    def test_rollback(self):
+        History.register(Group)
+        self.addCleanup(History.unregister, Group)
+        group = Group.objects.create(name="g")
+        History.objects.fetch(group).get_timeline()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    group.name = "phantom"
+                    group.save()
+                    1 / 0
+            group.name = "real"
+            group.save()
+        logs, fields = History.objects.fetch(group).get_timeline()
+        self.assertEqual([log.label for log in logs], ["real", "g"])
+        self.assertEqual(fields["name"], "real")
+
+    def test_retention(self):
+        self.change(first_name="first")
+        history = self.change(first_name="second")
+        logs, fields = history.get_timeline()
+        list(RetentionPolicy(User, keep_last=1).apply())
+        with self.assertNumQueries(1):
+            logs, fields = history.get_timeline()
+        self.assertEqual([log.pk for log in logs], [history.head_id])
+
+    @override_settings(MODEL_HISTORY_TIMELINE_CACHE=None)
+    def test_disabled(self):
+        history = self.change(first_name="first")
+        self.assertIsNone(get_timeline_cache())
+        with self.assertNumQueries(1):
+            logs, fields = history.get_timeline(size=1)
+        self.assertEqual([log.pk for log in logs], [history.head_id])
+        self.assertEqual(fields["first_name"], "first")
+        self.assertEqual(History().get_timeline(), ([], None))
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import datetime
+import io
+
+from django.contrib.auth.models import Group, User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from model_history.changes import index_logs
+from model_history.models import History, HistoryChangedField, HistoryLog
+from model_history.retention import RetentionPolicy
+
+
+class ChangedFieldTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password", "last_login"], index_changes=True)
+        History.register(Group)
+
+    def tearDown(self):
+        History.unregister(User)
+        History.unregister(Group)
+
+    def test_changed_field(self):
+        start = timezone.now()
+        user = User.objects.create(username="user")
+        user.email, user.username = "user@example.com", "changed"
+        user.save()
+        user.first_name = "first"
+        user.save()
+        group = Group.objects.create(name="group")
+        group.name = "changed"
+        group.save()
+
+        # first logs and unindexed models have no rows
+        self.assertEqual(
+            sorted(HistoryChangedField.objects.values_list("name", flat=True)), ["email", "first_name", "username"]
+        )
+        logs = list(HistoryLog.objects.for_object(user))
+        with self.assertNumQueries(1):
+            self.assertEqual(list(HistoryLog.objects.changed_field("email")), [logs[1]])
+        self.assertEqual(list(HistoryLog.objects.changed_field("username", since=start)), [logs[1]])
+        self.assertEqual(list(HistoryLog.objects.changed_field("first_name", until=logs[2].created_at)), [])
+        self.assertEqual(
+            list(HistoryLog.objects.changed_field("first_name", since=start, until=timezone.now())), [logs[2]]
+        )
+        self.assertEqual(list(HistoryLog.objects.changed_field("name")), [])
+
+        History.objects.log_many([user, group])
+        user.is_staff = True
+        History.objects.log_many([user])
+        self.assertEqual(HistoryLog.objects.changed_field("is_staff").get(), History.objects.fetch(user).head)
+
+        logs[2].delete()
+        self.assertFalse(HistoryChangedField.objects.filter(name="first_name").exists())
+
+    def test_retention(self):
+        user = User.objects.create(username="user")
+        for n in range(3):
+            user.first_name = f"first{n}"
+            user.save()
+        list(RetentionPolicy(User, keep_last=2).apply())
+        self.assertEqual(HistoryLog.objects.count(), 2)
+        self.assertEqual(HistoryChangedField.objects.count(), 2)
+        self.assertEqual(HistoryLog.objects.changed_field("first_name").count(), 2)
+
+        list(RetentionPolicy(User, keep_last=1, squash=True).apply())
+        self.assertEqual(HistoryLog.objects.count(), 2)
+        self.assertEqual(HistoryChangedField.objects.count(), 1)
+
+    def test_index_logs(self):
+        History.unregister(User)
+        History.register(User, exclude=["password", "last_login"])
+        users = [User.objects.create(username=f"user{n}") for n in range(3)]
+        for user in users:
+            user.email = f"{user.username}@example.com"
+            user.save()
+        users[0].is_active = False
+        users[0].save()
+        self.assertEqual(HistoryChangedField.objects.count(), 0)
+        History.unregister(User)
+        History.register(User, exclude=["password", "last_login"], index_changes=True)
+
+        logs = HistoryLog.objects.order_by("pk")
+        chunks = list(index_logs([User], chunk_size=4))
+        self.assertEqual(chunks, [(logs[3].pk, 1), (logs[6].pk, 3)])
+        self.assertEqual(HistoryLog.objects.changed_field("email").count(), 3)
+        # rebuilding is idempotent
+        list(index_logs([User], start_after=logs[3].pk))
+        self.assertEqual(HistoryChangedField.objects.count(), 4)
+
+        stdout = io.StringIO()
+        call_command("history_index", "--model", "auth.user", stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "4 changed fields indexed.\n")
+        self.assertEqual(HistoryChangedField.objects.count(), 4)
+        with self.assertRaisesMessage(CommandError, "Model auth.group is not registered with index_changes=True."):
+            call_command("history_index", "--model", "auth.group")
+
+    def test_timezone_bounds(self):
+        user = User.objects.create(username="user")
+        user.email = "user@example.com"
+        user.save()
+        tomorrow = timezone.now() + datetime.timedelta(days=1)
+        self.assertEqual(HistoryLog.objects.changed_field("email", since=tomorrow).count(), 0)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from model_history.compression import LazyJSON
+from model_history.models import History, HistoryLog
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = {"codec": "zlib", "min_size": 0}
+
+
+class CompressionTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"], keyframe_interval=3)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def get_stored(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT fields, updated FROM model_history_historylog ORDER BY id")
+            return cursor.fetchall()
+
+    def change_user(self, versions, username="user"):
+        user = User.objects.create(username=username)
+        for n in range(versions):
+            user.first_name = f"name {n}"
+            user.save()
+        return user
+
+    def check_timeline(self, user, versions):
+        snapshots = [fields["first_name"] for log, fields in History.objects.fetch(user).iter_snapshots()]
+        self.assertEqual(snapshots, ["", *(f"name {n}" for n in range(versions))])
+
+    @override_settings(MODEL_HISTORY_COMPRESSION=ZLIB)
+    def test_compressed(self):
+        user = self.change_user(4)
+        self.assertTrue(all('"__compressed__": "zlib"' in fields for fields, updated in self.get_stored()))
+        self.check_timeline(user, 4)
+
+        log = HistoryLog.objects.order_by("pk").first()
+        self.assertIsInstance(log.__dict__["fields"], LazyJSON)
+        self.assertEqual(log.fields["username"], "user")
+        self.assertIsInstance(log.__dict__["fields"], dict)
+
+        # values are decompressed on access even without a model instance
+        fields = HistoryLog.objects.values_list("fields", flat=True).order_by("pk").first()
+        self.assertEqual(fields["username"], "user")
+
+        # untouched values are saved as they are
+        log = HistoryLog.objects.order_by("pk").first()
+        stored = self.get_stored()[0]
+        log.label = "label"
+        log.save()
+        self.assertEqual(self.get_stored()[0], stored)
+
+    def test_min_size(self):
+        with override_settings(MODEL_HISTORY_COMPRESSION={"codec": "lzma", "min_size": 1000}):
+            self.change_user(1)
+        self.assertFalse(any("__compressed__" in fields for fields, updated in self.get_stored()))
+
+    def test_compress_logs(self):
+        user = self.change_user(4)
+        with override_settings(MODEL_HISTORY_COMPRESSION=ZLIB):
+            self.change_user(0, username="other")
+            call_command("history_compress", "--chunk-size", "2", stdout=io.StringIO())
+            self.assertTrue(all("__compressed__" in fields for fields, updated in self.get_stored()))
+            self.check_timeline(user, 4)
+
+            with override_settings(MODEL_HISTORY_COMPRESSION={"codec": "lzma", "min_size": 0}):
+                stdout = io.StringIO()
+                call_command("history_compress", stdout=stdout)
+                self.assertEqual(stdout.getvalue(), "6 logs rewritten (lzma).\n")
+                self.assertTrue(all('"__compressed__": "lzma"' in fields for fields, updated in self.get_stored()))
+
+        stdout = io.StringIO()
+        call_command("history_compress", stdout=stdout)
+        self.assertEqual(stdout.getvalue(), "6 logs rewritten (uncompressed).\n")
+        self.assertFalse(any("__compressed__" in fields for fields, updated in self.get_stored()))
+        self.check_timeline(user, 4)
+
+    def test_compress_logs_resume(self):
+        self.change_user(4)
+        with override_settings(MODEL_HISTORY_COMPRESSION={"codec": "zlib", "min_size": 100}):
+            stdout = io.StringIO()
+            call_command("history_compress", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "2 logs rewritten (zlib).\n")
+            # the small values stay uncompressed, they are already up to date
+            stdout = io.StringIO()
+            call_command("history_compress", stdout=stdout)
+            self.assertEqual(stdout.getvalue(), "0 logs rewritten (zlib).\n")
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        with override_settings(MODEL_HISTORY_COMPRESSION={"codec": "zstd", "min_size": 0}):
+            user = self.change_user(4)
+            self.check_timeline(user, 4)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd_dictionary(self):
+        samples = [
+            json.dumps({"id": n, "username": f"user{n}", "first_name": f"name {n}", "is_active": True}).encode()
+            for n in range(1000)
+        ]
+        fd, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(zstandard.train_dictionary(1024, samples).as_bytes())
+
+        with override_settings(MODEL_HISTORY_COMPRESSION={"codec": "zstd", "min_size": 0, "dictionary": path}):
+            user = self.change_user(4)
+        self.assertTrue(all('"__compressed__": "zstd"' in fields for fields, updated in self.get_stored()))
+
+        with override_settings(MODEL_HISTORY_COMPRESSION=ZLIB):
+            with self.assertRaisesMessage(ImproperlyConfigured, "add it to MODEL_HISTORY_COMPRESSION_DICTIONARIES"):
+                self.check_timeline(user, 4)
+            # the dictionary is still needed to read the logs compressed with it
+            with override_settings(MODEL_HISTORY_COMPRESSION_DICTIONARIES=[path]):
+                self.check_timeline(user, 4)
+                call_command("history_compress", stdout=io.StringIO())
+        self.assertTrue(all('"__compressed__": "zlib"' in fields for fields, updated in self.get_stored()))
+        self.check_timeline(user, 4)
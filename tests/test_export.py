@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import Group, User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from model_history.models import History, HistoryLog
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"])
+        History.register(Group)
+        self.user = User.objects.create(username="user")
+        self.user.first_name = "first"
+        self.user.save()
+        self.group = Group.objects.create(name="group")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def tearDown(self):
+        History.unregister(User)
+        History.unregister(Group)
+
+    def export(self, *args):
+        stdout = io.StringIO()
+        call_command("history_export", *args, stdout=stdout, stderr=io.StringIO())
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_jsonl(self):
+        rows = self.export()
+        self.assertEqual(
+            [(row["app_label"], row["model"], row["label"]) for row in rows],
+            [
+                ("auth", "user", "user"),
+                ("auth", "user", "user"),
+                ("auth", "group", "group"),
+            ],
+        )
+        self.assertEqual(rows[1]["source_id"], self.user.pk)
+        self.assertEqual(rows[1]["fields"]["first_name"], "first")
+        self.assertEqual(rows[1]["updated"], {"first_name": ""})
+
+        self.assertEqual(len(self.export("--model", "auth.group")), 1)
+        second = HistoryLog.objects.order_by("pk")[1]
+        self.assertEqual(
+            [row["id"] for row in self.export("--since", second.created_at.isoformat())],
+            [
+                second.pk,
+                second.pk + 1,
+            ],
+        )
+        self.assertEqual([row["id"] for row in self.export("--until", second.created_at.isoformat())], [second.pk - 1])
+        self.assertEqual(len(self.export("--after-id", str(second.pk))), 1)
+
+    @override_settings(MODEL_HISTORY_COMPRESSION={"codec": "zlib", "min_size": 0})
+    def test_compressed(self):
+        self.user.last_name = "last"
+        self.user.save()
+        self.assertEqual(self.export("--model", "auth.user")[-1]["fields"]["last_name"], "last")
+
+    def test_incremental_csv(self):
+        output = os.path.join(self.tmp.name, "logs.csv")
+        state = os.path.join(self.tmp.name, "state.json")
+        args = ["--format", "csv", "--output", output, "--state", state, "--model", "auth.user"]
+        call_command("history_export", *args, stderr=io.StringIO())
+        self.user.last_name = "last"
+        self.user.save()
+        call_command("history_export", *args, stderr=io.StringIO())
+        call_command("history_export", *args, stderr=io.StringIO())
+
+        with open(output, newline="") as fp:
+            rows = list(csv.DictReader(fp))
+        self.assertEqual([row["id"] for row in rows], [str(log.pk) for log in HistoryLog.objects.for_object(self.user)])
+        self.assertEqual(json.loads(rows[2]["updated"]), {"last_name": ""})
+        with open(state) as fp:
+            self.assertEqual(json.load(fp)["auth.user"]["id"], int(rows[-1]["id"]))
+
+    def test_directory(self):
+        call_command(
+            "history_export",
+            "--model",
+            "auth.user",
+            "--model",
+            "auth.group",
+            "--output",
+            self.tmp.name,
+            stderr=io.StringIO(),
+        )
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["auth.group.jsonl", "auth.user.jsonl"])
+        with open(os.path.join(self.tmp.name, "auth.user.jsonl")) as fp:
+            self.assertEqual(len(fp.readlines()), 2)
+
+        with self.assertRaises(CommandError):
+            call_command("history_export", "--processes", "2")
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from model_history.managers import LoggedQuerySet
+from model_history.models import History, HistoryLog
+
+
+class LoggedQuerySetTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"])
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_bulk_create(self):
+        with self.assertNumQueries(11):
+            # insert users, reload users, prefetch groups and permissions, savepoint, fetch histories,
+            # insert histories ignoring conflicts, fetch them, insert logs, update histories, release savepoint
+            users = LoggedQuerySet(User).bulk_create([User(username=f"user{n}") for n in range(10)])
+        self.assertEqual(History.objects.count(), 10)
+        self.assertEqual(HistoryLog.objects.count(), 10)
+        self.assertEqual(History.objects.fetch(users[3]).head.fields["username"], "user3")
+
+    def test_bulk_update(self):
+        users = LoggedQuerySet(User).bulk_create([User(username=f"user{n}") for n in range(10)])
+        for user in users[:5]:
+            user.first_name = "first"
+        LoggedQuerySet(User).bulk_update(users, ["first_name"], batch_size=3)
+        self.assertEqual(HistoryLog.objects.count(), 15)
+        history = History.objects.fetch(users[0])
+        self.assertEqual(history.head.updated, {"first_name": ""})
+
+    def test_update(self):
+        group = Group.objects.create(name="group")
+        users = LoggedQuerySet(User).bulk_create([User(username=f"user{n}") for n in range(4)])
+        users[0].groups.add(group)
+        rows = LoggedQuerySet(User).filter(username__in=["user0", "user1"]).update(is_staff=True)
+        self.assertEqual(rows, 2)
+        self.assertEqual(HistoryLog.objects.count(), 6)
+        history = History.objects.fetch(users[0])
+        self.assertEqual(history.head.fields["groups"], [group.pk])
+        self.assertEqual(history.head.updated, {"is_staff": False, "groups": []})
+
+    def test_unregistered(self):
+        History.unregister(User)
+        LoggedQuerySet(User).bulk_create([User(username="user")])
+        LoggedQuerySet(User).update(is_staff=True)
+        self.assertEqual(History.objects.count(), 0)
+
+
+class BulkHistoryTestCase(TestCase):
+    def test_fetch_many(self):
+        users = [User.objects.create(username=f"user{n}") for n in range(3)]
+        group = Group.objects.create(name="group")
+        History.objects.log(users[1])
+        ContentType.objects.get_for_model(group)
+
+        with self.assertNumQueries(2):
+            histories = History.objects.fetch_many([*users, group])
+        self.assertEqual(
+            [history.source_id for history in histories], [users[0].pk, users[1].pk, users[2].pk, group.pk]
+        )
+        self.assertEqual([history.pk is None for history in histories], [True, False, True, True])
+        self.assertEqual(histories[1].head.fields["username"], "user1")
+
+        with self.assertNumQueries(6):
+            # fetch, insert ignoring conflicts and fetch again, for each content type
+            histories = History.objects.fetch_many([*users, group], create=True)
+        self.assertTrue(all(history.pk for history in histories))
+        self.assertEqual(History.objects.count(), 4)
+        self.assertEqual(histories[3].label, "group")
+
+    def test_log_many(self):
+        users = [User.objects.create(username=f"user{n}") for n in range(3)]
+        group = Group.objects.create(name="group")
+        History.objects.log(users[0])
+
+        users[0].first_name = "first"
+        logs = History.objects.log_many([*users, group])
+        self.assertEqual(len(logs), 4)
+        self.assertEqual(HistoryLog.objects.count(), 5)
+        history = History.objects.fetch(users[0])
+        self.assertEqual(history.head.updated, {"first_name": ""})
+        self.assertEqual(History.objects.fetch(group).head.fields["name"], "group")
+
+        # unchanged instances are not logged again
+        self.assertEqual(History.objects.log_many([*users, group]), [])
+
+        logs = History.objects.log_many(users, exclude=["password"])
+        self.assertEqual(len(logs), 3)
+        self.assertNotIn("password", logs[0].fields)
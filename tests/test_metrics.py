@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from model_history import metrics
+from model_history.models import History
+
+
+class MetricsTestCase(TestCase):
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_noop(self):
+        self.assertEqual(metrics.get_collectors(), [])
+        self.assertIs(metrics.measure(User, "log"), metrics.NULL_MEASURE)
+
+    def test_memory_collector(self):
+        History.register(User, exclude=["password"], track_changes=True)
+        with metrics.MemoryCollector() as collector:
+            with self.captureOnCommitCallbacks(execute=True):
+                user = User.objects.create(username="user")
+            with self.captureOnCommitCallbacks(execute=True):
+                user.first_name = "first"
+                user.save()
+            user.save()
+        self.assertNotIn(collector, metrics.get_collectors())
+
+        stats = collector.aggregates()["auth.user"]
+        self.assertEqual(
+            {event: stats[event]["count"] for event in stats},
+            {"log": 2, "fetch": 2, "serialize": 2, "diff": 2, "write": 2, "skip": 1},
+        )
+        self.assertGreater(stats["serialize"]["bytes"], 0)
+        self.assertEqual(stats["write"]["queries"], 4)  # log insert and history update, for each log
+        self.assertGreater(stats["log"]["queries"], stats["write"]["queries"])
+        self.assertGreaterEqual(stats["log"]["time"], stats["write"]["time"])
+
+    def test_batch(self):
+        History.register(User, exclude=["password"], batch=True)
+        with metrics.MemoryCollector() as collector:
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.create(username="user1")
+                User.objects.create(username="user2")
+        stats = collector.aggregates()["auth.user"]
+        self.assertEqual(stats["write"]["count"], 1)
+        self.assertEqual(stats["diff"]["count"], 2)
+
+    @override_settings(MODEL_HISTORY_COLLECTORS=["model_history.metrics.CacheCollector"])
+    def test_command(self):
+        History.register(User, exclude=["password"])
+        User.objects.create(username="user")
+
+        stdout = io.StringIO()
+        call_command("history_metrics", "--json", "--reset", stdout=stdout)
+        stats = json.loads(stdout.getvalue())["auth.user"]
+        self.assertEqual(stats["log"]["count"], 1)
+        self.assertEqual(stats["write"]["queries"], 2)
+
+        stdout = io.StringIO()
+        call_command("history_metrics", stdout=stdout)
+        self.assertEqual(stdout.getvalue().splitlines()[1:], [])
@@ -1,7 +1,15 @@
 from __future__ import annotations
 
-from django.contrib.auth.models import User
+import unittest
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from model_history.models import History
 
@@ -30,3 +38,214 @@ class ModelLogTestCase(TestCase):
     def test_already(self):
         with self.assertRaises(History.AlreadyRegistered):
             History.register(User)
+
+    def test_serializer_class_cache(self):
+        callback = History._registry[User]
+        serializer_class = History.build_serializer_class(User, exclude_opt=["password"])
+        self.assertIs(callback.serializer_class, serializer_class)
+        user = User.objects.create_user(username="test")
+        data = serializer_class(user).data
+        self.assertEqual(data["username"], "test")
+        self.assertNotIn("password", data)
+        self.assertEqual(serializer_class(user).data, data)
+        History.unregister(User)
+        self.assertNotIn(serializer_class, History._serializers.values())
+        History.register(User, exclude=["password"])
+        self.assertIsNot(History._registry[User].serializer_class, serializer_class)
+
+    def test_head(self):
+        user = User.objects.create_user(username="test")
+        history = History.objects.fetch(user)
+        self.assertEqual(history.head, history.logs.get())
+        user.username = "test2"
+        user.save()
+        history = History.objects.fetch(user)
+        self.assertEqual(history.head, history.logs.order_by("created_at", "pk").last())
+        self.assertEqual(history.head.updated, {"username": "test"})
+
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        queries = [query["sql"] for query in ctx.captured_queries if "model_history_historylog" in query["sql"]]
+        # only the history lookup joins its last log
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(history.logs.count(), 2)
+
+        History.objects.update(head=None)
+        History.objects.all().update_heads()
+        self.assertEqual(History.objects.get().head, history.head)
+
+
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        History.register(Session)
+
+    def tearDown(self):
+        History.unregister(Session)
+
+    def test_log(self):
+        with self.assertNumQueries(5):
+            # insert session, fetch history, upsert history, insert log, update history
+            session = Session.objects.create(session_key="key", session_data="data", expire_date=timezone.now())
+        with self.assertNumQueries(4):
+            # the saved instance is serialized, not loaded again
+            session.session_data = "changed"
+            session.save()
+        with self.assertNumQueries(2):
+            # no changes, no writes
+            session.save()
+        with self.assertNumQueries(1):
+            History.objects.log(session)
+        with self.assertNumQueries(3):
+            # logging directly costs the same, without loading the content type or the instance
+            session.session_data = "unsaved"
+            History.objects.log(session)
+        history = History.objects.fetch(session)
+        self.assertEqual(history.logs.count(), 3)
+        self.assertEqual(history.head.updated, {"session_data": "changed"})
+
+    def test_fetched_source(self):
+        session = Session.objects.create(session_key="key", session_data="data", expire_date=timezone.now())
+        history = History.objects.fetch(session)
+        with self.assertNumQueries(0):
+            self.assertIs(history.source, session)
+            self.assertEqual(history.source_type.model_class(), Session)
+        history = History.objects.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(history.source, session)
+
+
+class TrackChangesTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password", "last_login"], track_changes=True)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_skip_untracked(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="test")
+        history = History.objects.fetch(user)
+        with mock.patch.object(History._registry[User], "serialize") as serialize:
+            with self.assertNumQueries(1):
+                user.last_login = timezone.now()
+                user.save(update_fields=["last_login"])
+            with self.assertNumQueries(1):
+                user.set_password("secret")
+                user.save()
+        serialize.assert_not_called()
+        self.assertEqual(history.logs.count(), 1)
+
+        user = User.objects.get(pk=user.pk)
+        with self.assertNumQueries(1):
+            user.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.username = "changed"
+            user.save()
+        self.assertEqual(history.logs.count(), 2)
+        user.save()
+        self.assertEqual(history.logs.count(), 2)
+
+    def test_rollback_retry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(username="test")
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                user.username = "changed"
+                user.save()
+                1 / 0
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        history = History.objects.fetch(user)
+        self.assertEqual(history.logs.count(), 2)
+        self.assertEqual(history.head.fields["username"], "changed")
+
+    def test_deferred(self):
+        user = User.objects.create_user(username="test")
+        user = User.objects.only("pk").get(pk=user.pk)
+        user.email = "test@example.com"
+        user.save(update_fields=["email"])
+        self.assertEqual(History.objects.fetch(user).head.updated, {"email": ""})
+
+
+class TrackChangesForeignKeyTestCase(TestCase):
+    def setUp(self):
+        History.register(Permission, track_changes=True)
+
+    def tearDown(self):
+        History.unregister(Permission)
+
+    def test_update_fields_attname(self):
+        permission = Permission.objects.create(
+            codename="test", name="test", content_type=ContentType.objects.get_for_model(User)
+        )
+        permission.content_type_id = ContentType.objects.get_for_model(Session).pk
+        permission.save(update_fields=["content_type_id"])
+        history = History.objects.fetch(permission)
+        self.assertEqual(history.logs.count(), 2)
+        self.assertEqual(history.head.updated, {"content_type": ContentType.objects.get_for_model(User).pk})
+
+
+class IdentityTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"])
+        History.register(Session)
+
+    def tearDown(self):
+        History.unregister(User)
+        History.unregister(Session)
+
+    def create_session(self, key):
+        return Session.objects.create(session_key=key, session_data="data", expire_date=timezone.now())
+
+    def test_char_pk(self):
+        session = self.create_session("abc")
+        history = History.objects.fetch(session)
+        self.assertEqual((history.source_id, history.source_key), (None, "abc"))
+        self.assertEqual(history.source, session)
+        self.assertEqual(history.head.fields["session_data"], "data")
+
+        session.session_data = "changed"
+        session.save()
+        self.assertEqual(History.objects.fetch(session).head.updated, {"session_data": "data"})
+
+        self.create_session("def")
+        self.assertEqual(
+            {pk: fields["session_data"] for pk, fields in History.objects.as_of(Session, timezone.now())},
+            {"abc": "changed", "def": "data"},
+        )
+        self.assertEqual(len(History.objects.fetch_many(Session.objects.all(), create=True)), 2)
+
+    def test_int_pk(self):
+        user = User.objects.create(username="user")
+        history = History.objects.fetch(user)
+        self.assertEqual((history.source_id, history.source_key), (user.pk, str(user.pk)))
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "SQLite query plan")
+    def test_lookup_index(self):
+        user = User.objects.create(username="user")
+        history = History.objects.fetch(user)
+        # the lookup uses the (source_key, source_type) unique index
+        plan = History.objects.filter(source_type=history.source_type, source_key=history.source_key).explain()
+        self.assertIn("USING INDEX", plan)
+        self.assertIn("source_key=? AND source_type_id=?", plan)
+
+    def test_concurrent_first_log(self):
+        History.unregister(User)
+        user = User.objects.create(username="user")
+        first, second = History.objects.fetch(user), History.objects.fetch(user)
+        first.save()
+        # the second insert hits the unique constraint and adopts the existing row
+        second.save()
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(History.objects.count(), 1)
+        self.assertEqual(History.objects.get().logs.count(), 1)
+
+        user = User.objects.create(username="other")
+        first, second = History.objects.fetch(user), History.objects.fetch(user)
+        first.save()
+        user.first_name = "changed"
+        user.save()
+        second.save()
+        history = History.objects.fetch(user)
+        self.assertEqual(history.logs.count(), 2)
+        self.assertEqual(history.head.updated, {"first_name": ""})
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from model_history import outbox
+from model_history.models import History, HistoryOutbox
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"], outbox=True)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_database_outbox(self):
+        user = User.objects.create_user(username="test")
+        user.first_name = "first"
+        user.save()
+        user.first_name = "second"
+        user.save()
+        self.assertEqual(HistoryOutbox.objects.count(), 3)
+        self.assertEqual(History.objects.count(), 0)
+
+        call_command("history_worker", once=True, stdout=StringIO())
+        self.assertEqual(HistoryOutbox.objects.count(), 0)
+        logs = History.objects.fetch(user).logs.order_by("pk")
+        self.assertEqual([log.fields["first_name"] for log in logs], ["", "first", "second"])
+        self.assertEqual(logs[2].updated, {"first_name": "first"})
+
+    def test_retry_is_idempotent(self):
+        user = User.objects.create_user(username="test")
+        entry = HistoryOutbox.objects.get()
+        outbox.apply([entry], outbox.get_outbox())
+        # a failed ack leaves the entry in the outbox, applying it again does not log twice
+        entry = HistoryOutbox(source_type=entry.source_type, source_key=str(user.pk), label="test", fields=entry.fields)
+        outbox.apply([entry], outbox.LocalOutbox())
+        self.assertEqual(History.objects.fetch(user).logs.count(), 1)
+
+    def test_concurrent_workers(self):
+        user = User.objects.create_user(username="test")
+        user.first_name = "first"
+        user.save()
+        database = outbox.DatabaseOutbox()
+        # two workers reading the same batch
+        first, second = database.get_batch(10), database.get_batch(10)
+        outbox.apply(first, database)
+        outbox.apply(second, database)
+        logs = History.objects.fetch(user).logs.order_by("pk")
+        self.assertEqual([log.fields["first_name"] for log in logs], ["", "first"])
+
+        user.first_name = "second"
+        user.save()
+        entry = HistoryOutbox.objects.get()
+        stale = HistoryOutbox.objects.get(pk=entry.pk)
+        stale.fields = {**stale.fields, "first_name": "stale"}
+        outbox.apply([entry], database)
+        # claimed before the other worker acked it: rolled back on ack
+        with mock.patch.object(database, "claim", return_value=True):
+            outbox.apply([stale], database)
+        logs = History.objects.fetch(user).logs.order_by("pk")
+        self.assertEqual([log.fields["first_name"] for log in logs], ["", "first", "second"])
+
+    def test_local_outbox(self):
+        local = outbox.LocalOutbox()
+        with mock.patch.object(outbox, "_outbox", local):
+            user = User.objects.create_user(username="test")
+            user.delete()
+            self.assertEqual(HistoryOutbox.objects.count(), 0)
+            self.assertEqual(len(local.queue), 2)
+            self.assertEqual(outbox.process(local, batch_size=1), 1)
+            self.assertEqual(outbox.process(local), 1)
+            self.assertEqual(outbox.process(local), 0)
+        self.assertEqual(History.objects.get().logs.count(), 1)
+
+
+class DefaultRouter:
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class OutboxDatabaseTestCase(TestCase):
+    databases = {"default", "other"}
+
+    @override_settings(DATABASE_ROUTERS=["tests.test_outbox.DefaultRouter"])
+    def test_database(self):
+        # logs are written to the database of the outbox, whatever the router says
+        source_type = ContentType.objects.db_manager("other").get_for_model(User)
+        for name in ["first", "second"]:
+            HistoryOutbox.objects.using("other").create(
+                source_type=source_type, source_key="1", label="user", fields={"first_name": name}
+            )
+
+        call_command("history_worker", once=True, database="other", stdout=StringIO())
+        self.assertFalse(HistoryOutbox.objects.using("other").exists())
+        self.assertFalse(History.objects.exists())
+        history = History.objects.using("other").get()
+        self.assertEqual(history.head.fields, {"first_name": "second"})
+        self.assertEqual(history.logs.count(), 2)
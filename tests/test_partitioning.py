@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, migrations
+from django.db.migrations.exceptions import IrreversibleError
+from django.db.migrations.state import ProjectState
+from django.test import TestCase
+
+from model_history.models import History, HistoryLog
+from model_history.partitioning import (
+    PartitionHistoryLog,
+    get_bounds,
+    get_partition_name,
+    is_partitioned,
+    parse_partition_name,
+)
+
+utc = datetime.timezone.utc
+
+
+class PartitioningTestCase(TestCase):
+    def test_bounds(self):
+        tm = datetime.datetime(2022, 12, 15, 10, tzinfo=utc)
+        self.assertEqual(
+            get_bounds(tm, "month"), (tm.replace(day=1, hour=0), datetime.datetime(2023, 1, 1, tzinfo=utc))
+        )
+        self.assertEqual(
+            get_bounds(tm, "year"),
+            (datetime.datetime(2022, 1, 1, tzinfo=utc), datetime.datetime(2023, 1, 1, tzinfo=utc)),
+        )
+        for interval in ["month", "year"]:
+            start, end = get_bounds(tm, interval)
+            self.assertEqual(parse_partition_name(get_partition_name(start, interval)), (start, end, interval))
+        self.assertIsNone(parse_partition_name("model_history_historylog_default"))
+
+    def test_fallback(self):
+        self.assertFalse(is_partitioned(connection))
+        operation = PartitionHistoryLog(interval="year")
+        self.assertEqual(operation.deconstruct(), ("PartitionHistoryLog", [], {"interval": "year", "ahead": 3}))
+        schema_editor = mock.Mock(connection=connection)
+        operation.database_forwards("model_history", schema_editor, None, None)
+        schema_editor.execute.assert_not_called()
+        migration = migrations.Migration("0001_partition", "tests")
+        migration.operations = [operation]
+        with self.assertRaises(IrreversibleError):
+            migration.unapply(ProjectState(), schema_editor)
+        with self.assertRaises(ValueError):
+            PartitionHistoryLog(interval="week")
+        with self.assertRaises(CommandError):
+            call_command("history_partitions")
+
+    def test_dropped_head(self):
+        History.register(User, exclude=["password"], keyframe_interval=3)
+        try:
+            user = User.objects.create_user(username="test")
+            user.first_name = "first"
+            user.save()
+            # what drop_partitions does when the last log of a history is dropped
+            history = History.objects.fetch(user)
+            history.snapshot, history.head, history.deltas = history.get_current_fields(), None, 0
+            history.save_base(update_fields=["snapshot", "head", "deltas"])
+            HistoryLog.objects.all().delete()
+
+            user.save()
+            self.assertEqual(HistoryLog.objects.count(), 0)
+            user.first_name = "second"
+            user.save()
+            log = HistoryLog.objects.get()
+            self.assertEqual((log.delta, log.updated), (False, {"first_name": "first"}))
+            self.assertEqual(log.fields["first_name"], "second")
+        finally:
+            History.unregister(User)
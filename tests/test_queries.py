@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from model_history.models import History, HistoryLog, HistoryLogQuerySet
+
+
+class AsOfTestCase(TestCase):
+    def tearDown(self):
+        History.unregister(User)
+
+    def check_as_of(self, num_queries):
+        users = [User.objects.create_user(username=f"user{n}") for n in range(3)]
+        pks = [user.pk for user in users]
+        before = timezone.now()
+        for n in range(4):
+            for user in users[:2]:
+                user.first_name = f"{user.username} {n}"
+                user.save()
+            if n == 1:
+                middle = timezone.now()
+        users[2].delete()
+        after = timezone.now()
+
+        self.assertEqual(list(History.objects.as_of(User, timezone.now() - timezone.timedelta(days=1))), [])
+        self.assertEqual(
+            {source_id: fields["first_name"] for source_id, fields in History.objects.as_of(User, before)},
+            {pk: "" for pk in pks},
+        )
+        with self.assertNumQueries(num_queries):
+            snapshots = dict(History.objects.as_of(User, middle, chunk_size=2))
+        self.assertEqual(
+            {pk: fields["first_name"] for pk, fields in snapshots.items()},
+            {
+                pks[0]: "user0 1",
+                pks[1]: "user1 1",
+                pks[2]: "",
+            },
+        )
+        queryset = User.objects.filter(username="user1")
+        self.assertEqual(
+            [(pk, fields["first_name"]) for pk, fields in History.objects.as_of(queryset, after)],
+            [(pks[1], "user1 3")],
+        )
+
+    def test_full(self):
+        History.register(User, exclude=["password"])
+        self.check_as_of(num_queries=1)
+
+    def test_delta(self):
+        History.register(User, exclude=["password"], keyframe_interval=3)
+        # the second query rebuilds the delta logs of the first chunk
+        self.check_as_of(num_queries=2)
+
+
+class HistoryLogQuerySetTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"])
+        self.users = [User.objects.create_user(username=f"user{n}") for n in range(3)]
+        for n in range(3):
+            for user in self.users:
+                user.first_name = f"{user.username} {n}"
+                user.save()
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_summaries(self):
+        self.assertIsInstance(HistoryLog.objects.all(), HistoryLogQuerySet)
+        log = HistoryLog.objects.summaries().first()
+        self.assertEqual(log.get_deferred_fields(), {"fields", "updated"})
+
+    def test_for_object(self):
+        logs = HistoryLog.objects.for_object(self.users[1])
+        self.assertEqual([log.label for log in logs], ["user1"] * 4)
+        self.assertEqual(logs[0].get_deferred_fields(), {"fields", "updated"})
+        self.assertEqual(
+            [log.updated.get("first_name") for log in logs.defer(None)],
+            [None, "", "user1 0", "user1 1"],
+        )
+
+    def test_between(self):
+        logs = list(HistoryLog.objects.order_by("created_at", "pk"))
+        self.assertEqual(list(HistoryLog.objects.between(logs[3].created_at).order_by("created_at", "pk")), logs[3:])
+        self.assertEqual(list(HistoryLog.objects.between(end=logs[3].created_at)), logs[:3])
+        self.assertEqual(list(HistoryLog.objects.between(logs[3].created_at, logs[5].created_at)), logs[3:5])
+
+    def test_page(self):
+        expected = list(HistoryLog.objects.order_by("history_id", "created_at", "pk"))
+        for reverse in (False, True):
+            logs, last = [], None
+            while True:
+                with self.assertNumQueries(1):
+                    page = list(HistoryLog.objects.summaries().page(after=last, size=5, reverse=reverse))
+                if not page:
+                    break
+                logs.extend(page)
+                last = page[-1]
+            self.assertEqual(logs, expected[::-1] if reverse else expected)
+
+        last = expected[5]
+        page = HistoryLog.objects.page(after=(last.history_id, last.created_at, last.pk), size=2)
+        self.assertEqual(list(page), expected[6:8])
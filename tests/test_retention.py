@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from model_history.models import History, HistoryLog
+from model_history.retention import RetentionPolicy
+
+
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"], keyframe_interval=3)
+        self.users = [User.objects.create_user(username=f"user{n}") for n in range(3)]
+        for n in range(6):
+            for user in self.users:
+                user.first_name = f"{user.username} {n}"
+                user.save()
+        self.expected = {
+            user.pk: [fields for log, fields in History.objects.fetch(user).iter_snapshots()] for user in self.users
+        }
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def check_snapshots(self, count):
+        for user in self.users:
+            history = History.objects.fetch(user)
+            snapshots = [fields for log, fields in history.iter_snapshots()]
+            self.assertEqual(snapshots, self.expected[user.pk][-count:])
+            self.assertEqual(history.head, history.logs.order_by("created_at", "pk").last())
+
+    def test_keep_last(self):
+        results = list(RetentionPolicy(User, keep_last=2).apply(batch_size=2, chunk_size=4))
+        self.assertEqual([deleted for last, deleted, reclaimed in results], [10, 5])
+        self.assertTrue(all(reclaimed > 0 for last, deleted, reclaimed in results))
+        self.assertEqual(HistoryLog.objects.count(), 6)
+        self.check_snapshots(2)
+
+    def test_squash(self):
+        list(RetentionPolicy(User, keep_last=2, squash=True).apply())
+        self.assertEqual(HistoryLog.objects.count(), 9)
+        self.check_snapshots(3)
+        for user in self.users:
+            first = History.objects.fetch(user).logs.order_by("created_at", "pk").first()
+            self.assertEqual((first.delta, first.updated), (False, {}))
+
+    def test_max_age(self):
+        HistoryLog.objects.exclude(pk__in=History.objects.values("head")).update(
+            created_at=timezone.now() - timezone.timedelta(days=10)
+        )
+        list(RetentionPolicy(User, max_age=5).apply())
+        self.assertEqual(HistoryLog.objects.count(), 3)
+        self.check_snapshots(1)
+
+    def test_resume(self):
+        first = History.objects.order_by("pk").first()
+        list(RetentionPolicy(User, keep_last=1).apply(start_after=first.pk))
+        self.assertEqual(first.logs.count(), 7)
+        self.assertEqual(HistoryLog.objects.count(), 9)
+
+    def test_chunk_transactions(self):
+        raw_delete = QuerySet._raw_delete
+        chunks = []
+
+        def fail_second_chunk(queryset, using):
+            if queryset.model is HistoryLog:
+                chunks.append(queryset)
+                if len(chunks) == 2:
+                    raise DatabaseError("chunk")
+            return raw_delete(queryset, using)
+
+        with mock.patch.object(QuerySet, "_raw_delete", fail_second_chunk):
+            with self.assertRaises(DatabaseError):
+                list(RetentionPolicy(User, keep_last=2).apply(chunk_size=4))
+        # the first chunk is committed on its own, the logs left are still rebuildable
+        self.assertLess(HistoryLog.objects.count(), 21)
+        for user in self.users:
+            snapshots = [fields for log, fields in History.objects.fetch(user).iter_snapshots()]
+            self.assertTrue(all(fields in self.expected[user.pk] for fields in snapshots))
+            self.assertEqual(snapshots[-2:], self.expected[user.pk][-2:])
+        list(RetentionPolicy(User, keep_last=2).apply(chunk_size=4))
+        self.check_snapshots(2)
+
+    @override_settings(MODEL_HISTORY_RETENTION={"auth.user": {"keep_last": 4}})
+    def test_command(self):
+        stdout = StringIO()
+        call_command("history_retention", stdout=stdout)
+        self.assertIn("auth.user: 9 logs deleted", stdout.getvalue())
+        self.check_snapshots(4)
+        call_command("history_retention", model="auth.user", keep_last=1, stdout=stdout)
+        self.check_snapshots(1)
+        with self.assertRaises(CommandError):
+            call_command("history_retention", keep_last=1, stdout=stdout)
+
+
+class RetentionDatabaseTestCase(TestCase):
+    databases = {"default", "other"}
+
+    def setUp(self):
+        History.register(User, exclude=["password"], keyframe_interval=3)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_database(self):
+        history = History.for_source(ContentType.objects.db_manager("other").get_for_model(User), 1)
+        for n in range(5):
+            history.add_log({"first_name": f"name {n}"}, "user", using="other")
+        call_command("history_retention", model="auth.user", keep_last=2, database="other", stdout=StringIO())
+        self.assertFalse(HistoryLog.objects.exists())
+        snapshots = [fields["first_name"] for log, fields in History.objects.using("other").get().iter_snapshots()]
+        self.assertEqual(snapshots, ["name 3", "name 4"])
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import datetime
+import decimal
+import sys
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from model_history.models import History
+from model_history.snapshots import get_default_engine, to_file, to_json
+
+
+class NativeSnapshotTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"], engine="native")
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_same_as_drf(self):
+        group = Group.objects.create(name="group")
+        user = User.objects.create_user(username="test", first_name="first")
+        user.groups.add(group)
+        user = User.objects.prefetch_related("groups").get(pk=user.pk)
+        for model, instance, exclude in [(User, user, ["password"]), (Permission, Permission.objects.first(), None)]:
+            drf = History.build_serializer_class(model, exclude_opt=exclude, engine="drf")
+            native = History.build_serializer_class(model, exclude_opt=exclude, engine="native")
+            self.assertEqual(native(instance).data, dict(drf(instance).data))
+
+    def test_relation_order(self):
+        groups = [Group.objects.create(name=f"group{n}") for n in range(3)]
+        user = User.objects.create_user(username="test")
+        user.groups.add(*groups)
+        pks = [group.pk for group in groups]
+        prefetched = User.objects.prefetch_related(Prefetch("groups", Group.objects.order_by("-pk"))).get(pk=user.pk)
+        for engine in ["drf", "native"]:
+            serializer_class = History.build_serializer_class(User, exclude_opt=["password"], engine=engine)
+            # unordered relations are serialized in primary key order, prefetched or not
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(serializer_class(user).data["groups"], pks)
+            self.assertIn("ORDER BY", queries[0]["sql"])
+            self.assertEqual(serializer_class(prefetched).data["groups"], pks)
+
+    def test_log(self):
+        user = User.objects.create_user(username="test")
+        user.is_staff = True
+        user.save()
+        history = History.objects.fetch(user)
+        self.assertEqual(history.logs.count(), 2)
+        self.assertEqual(history.head.updated, {"is_staff": False})
+        self.assertEqual(History._registry[User].serializer_class.__name__, "UserSnapshot")
+
+    def test_deferred(self):
+        user = User.objects.create_user(username="test", email="test@example.com")
+        user = User.objects.only("username").get(pk=user.pk)
+        data = History.build_serializer_class(User, exclude_opt=["password"], engine="native")(user).data
+        self.assertEqual(data["email"], "test@example.com")
+
+    def test_default_engine(self):
+        get_default_engine.cache_clear()
+        self.addCleanup(get_default_engine.cache_clear)
+        with mock.patch.dict(sys.modules, {"rest_framework": None}):
+            self.assertEqual(get_default_engine(), "native")
+            with mock.patch("builtins.__import__", side_effect=AssertionError("import")):
+                # the failing import is not repeated
+                self.assertEqual(get_default_engine(), "native")
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            History.build_serializer_class(User, engine="unknown")
+
+    def test_json(self):
+        self.assertEqual(to_json(decimal.Decimal("1.50")), "1.50")
+        self.assertEqual(to_json(uuid.UUID(int=1)), "00000000-0000-0000-0000-000000000001")
+        self.assertEqual(to_json(datetime.date(2022, 1, 2)), "2022-01-02")
+        self.assertEqual(to_json(datetime.timedelta(days=1, seconds=1)), "1 00:00:01")
+        self.assertEqual(to_file("path/file.txt"), "path/file.txt")
+        self.assertIsNone(to_file(""))
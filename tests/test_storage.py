@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from model_history.models import History, HistoryLog
+
+
+class DeltaStorageTestCase(TestCase):
+    def setUp(self):
+        History.register(User, exclude=["password"], keyframe_interval=3)
+
+    def tearDown(self):
+        History.unregister(User)
+
+    def test_keyframes(self):
+        user = User.objects.create_user(username="test")
+        expected = [History.objects.fetch(user).head.fields]
+        for n in range(5):
+            user.first_name = f"name {n}"
+            if n == 2:
+                user.last_name = "last"
+            user.save()
+            expected.append({**expected[-1], "first_name": user.first_name, "last_name": user.last_name})
+
+        history = History.objects.fetch(user)
+        logs = list(history.logs.order_by("created_at", "pk"))
+        self.assertEqual([log.delta for log in logs], [False, True, True, False, True, True])
+        self.assertEqual(logs[1].fields, {"first_name": "name 0"})
+        self.assertEqual(logs[1].updated, {"first_name": ""})
+        self.assertEqual(logs[3].fields, expected[3])
+        self.assertEqual(history.get_current_fields(), expected[-1])
+        self.assertEqual([fields for log, fields in history.iter_snapshots()], expected)
+        for log, fields in zip(logs, expected):
+            self.assertEqual(HistoryLog.objects.get(pk=log.pk).get_fields(), fields)
+
+    def test_no_change(self):
+        user = User.objects.create_user(username="test")
+        user.first_name = "first"
+        user.save()
+        user.save()
+        history = History.objects.fetch(user)
+        self.assertEqual(history.logs.count(), 2)
+        self.assertEqual(history.deltas, 1)
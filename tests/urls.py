@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from django.conf.urls.i18n import i18n_patterns
-from django.urls import re_path
+from django.contrib import admin
+from django.urls import path
 
-urlpatterns = []
+urlpatterns = [
+    path("admin/", admin.site.urls),
+]